@@ -1,27 +1,279 @@
 # app.py
 import typer
+import json
+import multiprocessing
+import os
+import shlex
+import tempfile
 from pathlib import Path
-from pdf_tools import merge_pdfs, split_pdf
+from pdf_tools import ocr_cache, load_pipeline_spec, OCR_MAX_MEMORY_MB
+from service import call
 
-app = typer.Typer(help="FileToolbox: Merge & Split PDF Files")
+app = typer.Typer(help="FileToolbox: Merge, Split & OCR PDF Files")
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    trace: Path = typer.Option(None, "--trace", help="Append timed spans (stages, subprocesses, bytes, pages) as JSON lines to this file"),
+    metrics: Path = typer.Option(None, "--metrics", help="Write Prometheus text-format totals for this run here"),
+    profile: Path = typer.Option(None, "--profile", help="Dump a cProfile trace (pstats format, e.g. for snakeviz or flameprof) here"),
+    local: bool = typer.Option(False, "--local", help="Run in this process even if 'app.py serve' is running"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Don't reuse or store memoized results (compress, PDF to Word, office conversions)"),
+):
+    """Global options, applied before the command runs."""
+    import telemetry
+
+    # Tracing and profiling only see work done in this process, and a running
+    # service reads its own environment, so --no-cache must run here too
+    if local or trace or metrics or profile or no_cache:
+        os.environ["FILETOOLBOX_LOCAL"] = "1"
+
+    if no_cache:
+        # Through the environment so batch workers see it too
+        os.environ["FILETOOLBOX_NO_CACHE"] = "1"
+
+    if trace or metrics:
+        trace_path = trace
+        if trace_path is None:
+            fd, name = tempfile.mkstemp(prefix="ftb-trace-", suffix=".jsonl")
+            os.close(fd)
+            trace_path = Path(name)
+        run_id = telemetry.enable(trace_path)
+
+        def finish():
+            telemetry.disable()
+            if metrics:
+                telemetry.write_prometheus(metrics, telemetry.read_spans(trace_path, run_id))
+            if not trace:
+                trace_path.unlink(missing_ok=True)
+
+        ctx.call_on_close(finish)
+
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(str(profile))
+
+        ctx.call_on_close(dump)
 
 @app.command()
 def merge(
-    inputs: list[Path] = typer.Argument(..., help="PDF files to merge"),
-    output: Path = typer.Option(..., "--output", "-o", help="Output PDF path")
+    inputs: list[str] = typer.Argument(..., help="PDF files to merge; select pages with file.pdf:1-10,15"),
+    output: Path = typer.Option(..., "--output", "-o", help="Output PDF path"),
+    dedupe: bool = typer.Option(True, "--dedupe/--no-dedupe", help="Store identical fonts/images only once"),
 ):
     """Merge multiple PDFs into one."""
-    result = merge_pdfs(inputs, output)
+    inputs = [str(Path(i).absolute()) for i in inputs]
+    result = call("merge_pdfs", inputs, str(output.absolute()), dedupe=dedupe)
     typer.echo(f"Merged into: {result}")
 
 @app.command()
 def split(
     source: Path = typer.Argument(..., help="PDF file to split"),
-    outdir: Path = typer.Option("output", "--outdir", "-d", help="Directory for split PDFs")
+    outdir: Path = typer.Option("output", "--outdir", "-d", help="Directory for split PDFs"),
+    mode: str = typer.Option("pages", "--mode", "-m", help="pages, ranges, every, bookmarks or size"),
+    ranges: str = typer.Option(None, "--ranges", help="For --mode ranges: e.g. '1-3,4-10,11-'"),
+    every: int = typer.Option(None, "--every", "-n", help="For --mode every: pages per file"),
+    max_mb: float = typer.Option(None, "--max-mb", help="For --mode size: maximum size per file in MB"),
+    workers: int = typer.Option(None, "--workers", "-w", help="Parallel writer processes (default: CPU count)"),
+    prune: bool = typer.Option(True, "--prune/--no-prune", help="Drop fonts/images a part doesn't use"),
 ):
-    """Split each page into a separate PDF."""
-    results = split_pdf(source, outdir)
+    """Split a PDF into pages, ranges, fixed-size chunks, bookmarks or size-limited parts."""
+    results = call("split_pdf", str(source.absolute()), str(outdir.absolute()), mode=mode, ranges=ranges,
+                   every=every, max_mb=max_mb, prune=prune, workers=workers)
     typer.echo(f"Split into {len(results)} files in {outdir}")
 
+@app.command()
+def ocr(
+    source: Path = typer.Argument(..., help="Scanned PDF to OCR"),
+    output: Path = typer.Option(..., "--output", "-o", help="Output PDF path"),
+    workers: int = typer.Option(None, "--workers", "-w", help="Tesseract worker processes (default: CPU count)"),
+    max_memory: int = typer.Option(OCR_MAX_MEMORY_MB, "--max-memory", "-m", help="Memory ceiling for page bitmaps, in MB"),
+    mode: str = typer.Option("searchable", "--mode", help="'searchable' (invisible text layer) or 'text' (re-typeset)"),
+    skip_text: bool = typer.Option(True, "--skip-text/--ocr-all", help="Skip pages that already have a text layer"),
+    lang: str = typer.Option("eng", "--lang", "-l", help="Tesseract language(s), e.g. eng+deu"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Reuse OCR results for identical page images"),
+    resume: bool = typer.Option(False, "--resume", help="Continue an interrupted run from its checkpoint (<output>.ftbjob.json)"),
+    preprocess: str = typer.Option("none", "--preprocess", help="Clean pages up before Tesseract: none, clean (grayscale, deskew, threshold, crop) or fast (clean at 200 dpi)"),
+    prep: list[str] = typer.Option([], "--prep", help="Override one preprocessing setting as key=value, repeatable (e.g. --prep dpi=150 --prep deskew=false)"),
+):
+    """OCR a scanned PDF page by page across a process pool."""
+    from batch_tools import parse_options
+
+    settings = {"preset": preprocess, **parse_options(prep)} if prep else preprocess
+    call("ocr_pdf", str(source.absolute()), str(output.absolute()), workers=workers, max_memory_mb=max_memory,
+         mode=mode, skip_text=skip_text, lang=lang, use_cache=cache, resume=resume, preprocess=settings)
+    typer.echo(f"OCR complete: {output}")
+    if cache:
+        stats = ocr_cache().stats()
+        typer.echo(f"OCR cache: {stats['hits']} hits / {stats['misses']} misses, "
+                   f"{stats['entries']} entries ({stats['size_mb']} MB)")
+
+@app.command()
+def compress(
+    source: Path = typer.Argument(..., help="PDF file to compress"),
+    output: Path = typer.Option(..., "--output", "-o", help="Output PDF path"),
+    target_mb: float = typer.Option(None, "--target-mb", "-t", help="Best quality that fits in this many MB"),
+    chunk_pages: int = typer.Option(None, "--chunk-pages", help="Compress chunks of this many pages in parallel Ghostscript processes"),
+    workers: int = typer.Option(None, "--workers", "-w", help="Parallel Ghostscript processes with --chunk-pages (default: CPU count)"),
+):
+    """Compress a PDF with Ghostscript."""
+    call("compress_pdf", str(source.absolute()), str(output.absolute()), target_mb,
+         chunk_pages=chunk_pages, workers=workers)
+    typer.echo(f"Compressed: {output} ({output.stat().st_size / (1024 * 1024):.2f} MB)")
+
+@app.command()
+def rotate(
+    source: Path = typer.Argument(..., help="PDF file to rotate"),
+    output: Path = typer.Option(..., "--output", "-o", help="Output PDF path (may be SOURCE itself with --incremental)"),
+    angle: int = typer.Option(90, "--angle", "-a", help="Clockwise rotation in degrees, a multiple of 90"),
+    pages: str = typer.Option(None, "--pages", help="Only these pages, e.g. '3,7-9' (default: all)"),
+    incremental: bool = typer.Option(False, "--incremental", help="Append only the changed pages to the original bytes instead of rewriting"),
+):
+    """Rotate all or selected pages of a PDF."""
+    call("rotate_pdf", str(source.absolute()), str(output.absolute()), angle, pages=pages, incremental=incremental)
+    typer.echo(f"Rotated: {output}")
+
+@app.command()
+def watermark(
+    source: Path = typer.Argument(..., help="PDF file to watermark"),
+    output: Path = typer.Option(..., "--output", "-o", help="Output PDF path (may be SOURCE itself with --incremental)"),
+    text: str = typer.Option(None, "--text", "-t", help="Watermark text"),
+    image: Path = typer.Option(None, "--image", help="Watermark image instead of text"),
+    opacity: float = typer.Option(0.3, "--opacity", help="0 (invisible) to 1 (opaque)"),
+    pages: str = typer.Option(None, "--pages", help="Only these pages, e.g. '3,7-9' (default: all)"),
+    incremental: bool = typer.Option(False, "--incremental", help="Append only the stamp and changed pages to the original bytes instead of rewriting"),
+):
+    """Stamp text or an image on all or selected pages of a PDF."""
+    if bool(text) == bool(image):
+        raise typer.BadParameter("Give either --text or --image.")
+    if text:
+        call("add_text_watermark", str(source.absolute()), str(output.absolute()), text,
+             opacity=opacity, pages=pages, incremental=incremental)
+    else:
+        call("add_image_watermark", str(source.absolute()), str(output.absolute()), str(image.absolute()),
+             opacity=opacity, pages=pages, incremental=incremental)
+    typer.echo(f"Watermarked: {output}")
+
+@app.command()
+def batch(
+    operation: str = typer.Argument(..., help="Operation to run: compress, rotate, watermark, protect, unlock, ocr, split, to-docx, to-excel, to-pptx, to-images, office-to-pdf"),
+    source: str = typer.Argument(..., help="Input directory or glob pattern (quote it, e.g. 'scans/**/*.pdf')"),
+    outdir: Path = typer.Option("output", "--outdir", "-d", help="Directory for results"),
+    workers: int = typer.Option(None, "--workers", "-w", help="Parallel worker processes (default: CPU count)"),
+    option: list[str] = typer.Option([], "--option", "-p", help="Operation option as key=value, repeatable (e.g. -p angle=180)"),
+    recursive: bool = typer.Option(False, "--recursive", "-r", help="Recurse into subdirectories when SOURCE is a directory"),
+    summary: Path = typer.Option(None, "--summary", "-s", help="Write the JSON summary here (default: <outdir>/batch_summary.json)"),
+):
+    """Run one operation over every matching file in a single process pool."""
+    from batch_tools import OPERATIONS, collect_inputs, parse_options, run_batch
+
+    if operation not in OPERATIONS:
+        raise typer.BadParameter(f"Unknown operation. Choose from: {', '.join(OPERATIONS)}")
+    inputs = collect_inputs(source, operation, recursive)
+    if not inputs:
+        typer.echo("No matching input files.")
+        raise typer.Exit(1)
+
+    def progress(record, done, total):
+        status = "ok  " if record["ok"] else "FAIL"
+        line = f"[{done}/{total}] {status} {record['input']} ({record['seconds']}s)"
+        if not record["ok"]:
+            line += f" - {record['error']}"
+        typer.echo(line)
+
+    result = run_batch(operation, inputs, outdir, workers, parse_options(option), on_result=progress)
+    summary = summary or outdir / "batch_summary.json"
+    summary.write_text(json.dumps(result, indent=2))
+    typer.echo(f"{result['succeeded']}/{result['total']} succeeded in {result['elapsed_s']}s. Summary: {summary}")
+    if result["failed"]:
+        raise typer.Exit(1)
+
+@app.command()
+def pipeline(
+    source: Path = typer.Argument(..., help="PDF file to process"),
+    output: Path = typer.Option(..., "--output", "-o", help="Output PDF path"),
+    step: list[str] = typer.Option([], "--step", "-s", help="Step as 'op key=value ...', repeatable, applied in order (e.g. -s 'rotate angle=180 pages=1-3' -s 'watermark text=DRAFT')"),
+    spec: Path = typer.Option(None, "--spec", help="JSON or YAML file listing the steps instead of --step"),
+):
+    """Run rotate / watermark / protect / compress steps in a single read and write of the PDF."""
+    from batch_tools import parse_options
+
+    if bool(step) == bool(spec):
+        raise typer.BadParameter("Give either --step options or --spec, not both.")
+    if spec:
+        steps = load_pipeline_spec(spec)
+    else:
+        steps = []
+        for text in step:
+            op, *pairs = shlex.split(text)
+            steps.append({"op": op, **parse_options(pairs)})
+    result = call("run_pipeline", str(source.absolute()), str(output.absolute()), steps)
+    typer.echo(f"Applied {' -> '.join(result['steps'])} to {result['pages']} pages: {result['output']}")
+
+@app.command()
+def inspect(
+    source: Path = typer.Argument(..., help="PDF file to profile"),
+    as_json: bool = typer.Option(False, "--json", help="Print the full per-page profile as JSON"),
+    refresh: bool = typer.Option(False, "--refresh", help="Profile again even if the file is already indexed"),
+):
+    """Show what a PDF contains: text/scanned pages, images, fonts, encryption, likely tables."""
+    from inspect_tools import document_profile, summary
+
+    profile = document_profile(source, refresh=refresh)
+    if as_json:
+        typer.echo(json.dumps(profile, indent=2))
+        return
+    for key, value in summary(profile).items():
+        typer.echo(f"{key.replace('_', ' ')}: {value}")
+
+@app.command("cache")
+def cache_stats():
+    """Show entries, size and hit rate of the on-disk caches."""
+    from cache import result_store
+    from inspect_tools import profile_index
+
+    for name, store in (("results", result_store()), ("ocr", ocr_cache()), ("profiles", profile_index())):
+        stats = store.stats()
+        typer.echo(f"{name}: {stats['entries']} entries ({stats['size_mb']} MB), "
+                   f"{stats['hits']} hits / {stats['misses']} misses (hit rate {stats['hit_rate']:.0%})")
+
+@app.command()
+def serve(
+    port: int = typer.Option(0, "--port", help="Port on 127.0.0.1 (default: any free port)"),
+    max_queue: int = typer.Option(32, "--max-queue", help="Queued + running jobs before new submissions are refused"),
+    stop: bool = typer.Option(False, "--stop", help="Stop the running service"),
+    status: bool = typer.Option(False, "--status", help="Show whether a service is running"),
+):
+    """Run a local service that keeps libraries loaded; other commands use it automatically."""
+    import service
+
+    running = service.client()
+    if stop or status:
+        if running is None:
+            typer.echo("No service running.")
+            raise typer.Exit(1 if status else 0)
+        if stop:
+            running.stop()
+            typer.echo("Service stopped.")
+        else:
+            info = running.health()
+            typer.echo(f"Service pid {info['pid']}: {info['outstanding']}/{info['max_queue']} jobs outstanding, "
+                       f"up {info['uptime']}s")
+        return
+    if running is not None:
+        typer.echo("A service is already running.")
+        raise typer.Exit(1)
+    typer.echo(f"Serving on 127.0.0.1 (state in {service.STATE_FILE}); Ctrl+C to stop.")
+    try:
+        service.serve(port, max_queue)
+    except KeyboardInterrupt:
+        pass
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app()
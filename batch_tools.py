@@ -0,0 +1,179 @@
+# batch_tools.py
+import glob, json, os, time, traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pdf_tools
+import office_tools
+
+PDF_EXTS = (".pdf",)
+OFFICE_EXTS = (".docx", ".doc", ".xlsx", ".xls", ".pptx", ".ppt", ".odt", ".ods", ".odp")
+
+
+def _out(outdir: Path, src: Path, suffix: str) -> str:
+    return str(outdir / f"{src.stem}{suffix}")
+
+
+def _compress(src, outdir, target_mb=None, **opts):
+    return pdf_tools.compress_pdf(src, _out(outdir, src, ".pdf"), target_mb, **opts)
+
+def _rotate(src, outdir, angle=90, **opts):
+    out = _out(outdir, src, ".pdf")
+    pdf_tools.rotate_pdf(str(src), out, int(angle), **opts)
+    return out
+
+def _watermark(src, outdir, text="CONFIDENTIAL", **opts):
+    out = _out(outdir, src, ".pdf")
+    pdf_tools.add_text_watermark(str(src), out, str(text), **opts)
+    return out
+
+def _protect(src, outdir, password, **opts):
+    out = _out(outdir, src, ".pdf")
+    pdf_tools.protect_pdf(str(src), out, str(password), **opts)
+    return out
+
+def _unlock(src, outdir, password, **opts):
+    out = _out(outdir, src, ".pdf")
+    pdf_tools.unlock_pdf(str(src), out, str(password), **opts)
+    return out
+
+def _ocr(src, outdir, **opts):
+    out = _out(outdir, src, ".pdf")
+    # The batch pool already uses every core, so each file gets one OCR worker
+    opts.setdefault("workers", 1)
+    pdf_tools.ocr_pdf(str(src), out, **opts)
+    return out
+
+def _split(src, outdir, **opts):
+    opts.setdefault("workers", 1)  # one per file, as for _ocr
+    return pdf_tools.split_pdf(src, outdir / src.stem, **opts)
+
+def _to_docx(src, outdir, **opts):
+    out = _out(outdir, src, ".docx")
+    opts.setdefault("workers", 1)
+    pdf_tools.pdf_to_docx(str(src), out, **opts)
+    return out
+
+def _to_excel(src, outdir, **opts):
+    out = _out(outdir, src, ".xlsx")
+    opts.setdefault("workers", 1)
+    pdf_tools.pdf_to_excel(str(src), out, **opts)
+    return out
+
+def _to_pptx(src, outdir, **opts):
+    out = _out(outdir, src, ".pptx")
+    opts.setdefault("workers", 1)
+    pdf_tools.pdf_to_pptx(str(src), out, **opts)
+    return out
+
+def _to_images(src, outdir, **opts):
+    folder = outdir / src.stem
+    folder.mkdir(parents=True, exist_ok=True)
+    opts.setdefault("workers", 1)
+    return pdf_tools.pdf_to_images(str(src), str(folder), **opts)
+
+def _office_to_pdf(src, outdir, **opts):
+    return office_tools.convert_with_soffice(str(src), "pdf", str(outdir), **opts)
+
+
+# operation name -> (function, accepted input extensions)
+OPERATIONS = {
+    "compress": (_compress, PDF_EXTS),
+    "rotate": (_rotate, PDF_EXTS),
+    "watermark": (_watermark, PDF_EXTS),
+    "protect": (_protect, PDF_EXTS),
+    "unlock": (_unlock, PDF_EXTS),
+    "ocr": (_ocr, PDF_EXTS),
+    "split": (_split, PDF_EXTS),
+    "to-docx": (_to_docx, PDF_EXTS),
+    "to-excel": (_to_excel, PDF_EXTS),
+    "to-pptx": (_to_pptx, PDF_EXTS),
+    "to-images": (_to_images, PDF_EXTS),
+    "office-to-pdf": (_office_to_pdf, OFFICE_EXTS),
+}
+
+
+def parse_options(pairs: list[str]) -> dict:
+    """Turn ["angle=180", "text=DRAFT"] into kwargs; values are parsed as JSON when possible."""
+    options = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Option must look like key=value: {pair}")
+        try:
+            options[key.strip().replace("-", "_")] = json.loads(value)
+        except json.JSONDecodeError:
+            options[key.strip().replace("-", "_")] = value
+    return options
+
+
+def collect_inputs(source: str, operation: str, recursive: bool = False) -> list[Path]:
+    """Expand a directory or glob pattern into the files the operation accepts."""
+    exts = OPERATIONS[operation][1]
+    if os.path.isdir(source):
+        pattern = "**/*" if recursive else "*"
+        paths = Path(source).glob(pattern)
+    else:
+        paths = (Path(p) for p in glob.glob(source, recursive=True))
+    return sorted(p for p in paths if p.is_file() and p.suffix.lower() in exts)
+
+
+def _run_one(operation: str, src: str, outdir: str, options: dict) -> dict:
+    func = OPERATIONS[operation][0]
+    start = time.perf_counter()
+    record = {"input": src, "ok": True, "outputs": [], "error": None}
+    try:
+        result = func(Path(src), Path(outdir), **options)
+        outputs = result if isinstance(result, (list, tuple)) else [result]
+        record["outputs"] = [str(o) for o in outputs]
+    except Exception as e:
+        record["ok"] = False
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["traceback"] = traceback.format_exc()
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(operation: str, inputs: list[Path], outdir, workers: int | None = None,
+              options: dict | None = None, on_result=None) -> dict:
+    """
+    Run one operation over many files in a process pool.
+    Failures are recorded per file and never abort the run.
+    on_result(record, done, total) is called as each file finishes.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{operation}'. Choose from: {', '.join(OPERATIONS)}")
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    options = options or {}
+    workers = workers or os.cpu_count() or 1
+
+    started = time.time()
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_run_one, operation, str(src), str(outdir), options): src for src in inputs
+        }
+        for fut in as_completed(futures):
+            try:
+                record = fut.result()
+            except Exception as e:  # worker died (e.g. BrokenProcessPool)
+                record = {"input": str(futures[fut]), "ok": False, "outputs": [],
+                          "error": f"{type(e).__name__}: {e}", "seconds": None}
+            records.append(record)
+            if on_result:
+                on_result(record, len(records), len(inputs))
+
+    records.sort(key=lambda r: r["input"])
+    failed = [r for r in records if not r["ok"]]
+    return {
+        "operation": operation,
+        "options": options,
+        "workers": workers,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "elapsed_s": round(time.time() - started, 3),
+        "total": len(records),
+        "succeeded": len(records) - len(failed),
+        "failed": len(failed),
+        "files": records,
+    }
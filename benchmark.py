@@ -0,0 +1,517 @@
+# benchmark.py
+"""
+Benchmarks for pdf_tools / office_tools on a generated corpus.
+
+    python benchmark.py run --sizes 10,100 --out bench.json
+    python benchmark.py run --ops compress,ocr --baseline bench.json
+    python benchmark.py compare old.json new.json
+    python benchmark.py startup --budget 1.0
+    python benchmark.py ocr-preprocess --presets none,clean,fast
+
+The corpus is deterministic (fixed seeds) and cached under --corpus, so two
+runs on the same machine measure the same inputs. Each case runs in a fresh
+spawned process, which keeps peak RSS per operation honest. Cases that need
+a binary that isn't installed (gs, tesseract, soffice) are recorded as skipped.
+"""
+import difflib, json, os, platform, random, resource, shutil, subprocess, sys, time, traceback
+import multiprocessing
+from pathlib import Path
+
+import typer
+
+CORPUS_KINDS = ("text", "images", "scanned", "tables")
+DEFAULT_SIZES = "10,100"
+SEED = 1234
+
+app = typer.Typer(help="FileToolbox benchmarks")
+
+
+# ---------------------------------------------------------------- corpus
+
+def _lorem(rng: random.Random, words: int) -> str:
+    vocab = ("invoice total amount report quarter revenue page section figure table "
+             "customer order shipping balance summary account payment date item").split()
+    return " ".join(rng.choice(vocab) for _ in range(words))
+
+
+def _noise_image(rng: random.Random, w: int, h: int):
+    """Smooth random colour field: photo-like enough that JPEG has real work to do."""
+    from PIL import Image
+    small = Image.frombytes("RGB", (16, 12), bytes(rng.randrange(256) for _ in range(16 * 12 * 3)))
+    return small.resize((w, h), Image.BICUBIC)
+
+
+def _scan_image(rng: random.Random, page_no: int):
+    """A 150 dpi grayscale 'photocopy' of a text page, no text layer."""
+    from PIL import Image, ImageDraw
+    img = Image.new("L", (1275, 1650), 235)
+    draw = ImageDraw.Draw(img)
+    draw.text((120, 80), f"Scanned page {page_no}", fill=20)
+    for line in range(40):
+        draw.text((120, 130 + line * 36), _lorem(rng, 12), fill=30)
+    noise = Image.effect_noise(img.size, 12)
+    return Image.blend(img, noise, 0.15)
+
+
+def _build_pdf(kind: str, pages: int, path: Path):
+    import io
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(f"{SEED}-{kind}-{pages}")
+    width, height = letter
+    c = canvas.Canvas(str(path), pagesize=letter)
+    c.setTitle(f"benchmark {kind} {pages}")
+    pool = []
+    if kind == "images":
+        # A pool of distinct photos, cycled, so the file carries many unique images
+        for _ in range(min(pages, 50)):
+            buf = io.BytesIO()
+            _noise_image(rng, 1200, 900).save(buf, "JPEG", quality=90)
+            pool.append(ImageReader(io.BytesIO(buf.getvalue())))
+
+    for n in range(1, pages + 1):
+        if n % 10 == 1:
+            c.bookmarkPage(f"p{n}")
+            c.addOutlineEntry(f"Section {n // 10 + 1}", f"p{n}")
+        if kind == "text":
+            c.setFont("Helvetica", 10)
+            for line in range(60):
+                c.drawString(50, height - 50 - line * 12, _lorem(rng, 14))
+        elif kind == "images":
+            c.drawString(50, height - 40, f"Photo page {n}")
+            c.drawImage(pool[(n - 1) % len(pool)], 50, 120, width - 100, (width - 100) * 0.75)
+        elif kind == "scanned":
+            buf = io.BytesIO()
+            _scan_image(rng, n).save(buf, "JPEG", quality=75)
+            c.drawImage(ImageReader(io.BytesIO(buf.getvalue())), 0, 0, width, height)
+        elif kind == "tables":
+            rows, cols = 30, 6
+            x0, y0, cw, rh = 40, height - 60, (width - 80) / cols, 20
+            for r in range(rows + 1):
+                c.line(x0, y0 - r * rh, x0 + cols * cw, y0 - r * rh)
+            for k in range(cols + 1):
+                c.line(x0 + k * cw, y0, x0 + k * cw, y0 - rows * rh)
+            c.setFont("Helvetica", 8)
+            for r in range(rows):
+                for k in range(cols):
+                    text = f"Col {k + 1}" if r == 0 else f"{rng.randrange(100000) / 100:.2f}"
+                    c.drawString(x0 + k * cw + 3, y0 - r * rh - 14, text)
+        c.showPage()
+    c.save()
+
+
+def _build_docx(pages: int, path: Path):
+    from docx import Document
+    rng = random.Random(f"{SEED}-docx-{pages}")
+    doc = Document()
+    for n in range(pages):
+        doc.add_heading(f"Section {n + 1}", level=1)
+        for _ in range(6):
+            doc.add_paragraph(_lorem(rng, 60))
+        doc.add_page_break()
+    doc.save(str(path))
+
+
+def _build_xlsx(pages: int, path: Path):
+    from openpyxl import Workbook
+    rng = random.Random(f"{SEED}-xlsx-{pages}")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("data")
+    ws.append([f"Col {k + 1}" for k in range(8)])
+    for _ in range(pages * 40):  # roughly a printed page per 40 rows
+        ws.append([rng.randrange(100000) / 100 for _ in range(8)])
+    wb.save(str(path))
+
+
+def build_corpus(root: Path, sizes: list[int]) -> dict:
+    """Generate (or reuse) every corpus file; returns {(kind, pages): path}."""
+    root.mkdir(parents=True, exist_ok=True)
+    files = {}
+    for pages in sizes:
+        for kind in CORPUS_KINDS:
+            files[(kind, pages)] = root / f"{kind}_{pages}.pdf"
+        files[("docx", pages)] = root / f"docx_{pages}.docx"
+        files[("xlsx", pages)] = root / f"xlsx_{pages}.xlsx"
+        files[("jpgs", pages)] = root / f"jpgs_{pages}"
+
+    for (kind, pages), path in files.items():
+        if path.exists():
+            continue
+        typer.echo(f"  generating {path.name}")
+        tmp = path.with_name(path.name + ".part")
+        if kind == "docx":
+            _build_docx(pages, tmp)
+        elif kind == "xlsx":
+            _build_xlsx(pages, tmp)
+        elif kind == "jpgs":
+            tmp.mkdir(exist_ok=True)
+            rng = random.Random(f"{SEED}-jpgs-{pages}")
+            for n in range(pages):
+                _noise_image(rng, 1600, 1200).save(tmp / f"img_{n:04d}.jpg", "JPEG", quality=90)
+        else:
+            _build_pdf(kind, pages, tmp)
+        os.replace(tmp, path)
+    return files
+
+
+# ---------------------------------------------------------------- cases
+
+def _have_gs() -> bool:
+    import pdf_tools
+    try:
+        pdf_tools._gs_path()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _have_tesseract() -> bool:
+    """
+    The bundled Tesseract pdf_tools points at, or else one on PATH (then
+    handed to pdf_tools, before any worker processes are started).
+    """
+    import pdf_tools
+    if os.path.exists(pdf_tools.TESSERACT_CMD):
+        return True
+    cmd = shutil.which("tesseract")
+    if cmd is None:
+        return False
+    pdf_tools.TESSERACT_CMD = cmd  # for a pytesseract not imported yet
+    try:
+        pdf_tools.pytesseract.pytesseract.tesseract_cmd = cmd
+    except ImportError:
+        return False
+    return True
+
+
+def _have_poppler() -> bool:
+    """The bundled Poppler, or else pdftoppm on PATH (POPPLER_PATH=None makes pdf2image search it)."""
+    import pdf_tools
+    if pdf_tools.POPPLER_PATH and os.path.isdir(pdf_tools.POPPLER_PATH):
+        return True
+    if shutil.which("pdftoppm") is None:
+        return False
+    pdf_tools.POPPLER_PATH = None
+    return True
+
+
+def _have_soffice() -> bool:
+    import office_tools
+    try:
+        office_tools._soffice_path()
+        return True
+    except RuntimeError:
+        return False
+
+
+# op -> (corpus kinds it runs on, availability check or None, runner(src, out_dir) -> output path(s))
+def _cases():
+    import office_tools
+    import pdf_tools
+    return {
+        "merge": (("text", "images"), None,
+                  lambda src, out: pdf_tools.merge_pdfs([str(src), str(src)], out / "merged.pdf")),
+        "split": (("text", "images"), None,
+                  lambda src, out: pdf_tools.split_pdf(src, out, mode="every", every=10)),
+        "compress": (("images", "scanned"), _have_gs,
+                     lambda src, out: pdf_tools.compress_pdf(str(src), str(out / "small.pdf"), use_cache=False)),
+        "rotate": (("text", "images"), None,
+                   lambda src, out: pdf_tools.rotate_pdf(str(src), str(out / "r.pdf")) or out / "r.pdf"),
+        "watermark": (("text", "images"), None,
+                      lambda src, out: pdf_tools.add_text_watermark(str(src), str(out / "w.pdf"), "DRAFT")
+                      or out / "w.pdf"),
+        "protect": (("text",), None,
+                    lambda src, out: pdf_tools.protect_pdf(str(src), str(out / "p.pdf"), "pw") or out / "p.pdf"),
+        "pipeline": (("text", "images"), None,
+                     lambda src, out: pdf_tools.run_pipeline(
+                         str(src), str(out / "pipe.pdf"),
+                         [{"op": "rotate", "angle": 90}, {"op": "watermark", "text": "DRAFT"},
+                          {"op": "protect", "password": "pw"}])["output"]),
+        "to-docx": (("text", "tables"), None,
+                    lambda src, out: pdf_tools.pdf_to_docx(str(src), str(out / "out.docx"), use_cache=False)["output"]),
+        "to-excel": (("tables",), None,
+                     lambda src, out: pdf_tools.pdf_to_excel(str(src), str(out / "out.xlsx"))),
+        "to-pptx": (("images",), None,
+                    lambda src, out: pdf_tools.pdf_to_pptx(str(src), str(out / "out.pptx")) or out / "out.pptx"),
+        "to-images": (("text", "images"), None,
+                      lambda src, out: pdf_tools.pdf_to_images(str(src), str(out)) or out),
+        "images-to-pdf": (("jpgs",), None,
+                          lambda src, out: pdf_tools.images_to_pdf(sorted(str(p) for p in src.iterdir()),
+                                                                   str(out / "imgs.pdf")) or out / "imgs.pdf"),
+        "ocr": (("scanned",), lambda: _have_tesseract() and _have_poppler(),
+                lambda src, out: pdf_tools.ocr_pdf(str(src), str(out / "ocr.pdf"), use_cache=False)
+                or out / "ocr.pdf"),
+        "office-to-pdf": (("docx", "xlsx"), _have_soffice,
+                          lambda src, out: office_tools.convert_with_soffice(str(src), "pdf", str(out), use_cache=False)),
+    }
+
+
+def _size(path) -> int:
+    path = Path(path)
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+def _peak_rss_kb() -> int:
+    """
+    Peak RSS of this process and any pools it started, in KiB. ru_maxrss survives
+    exec on Linux (a spawned child would report its parent's size), so our own
+    peak comes from VmHWM, which starts fresh with the new address space.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open("/proc/self/status") as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        pass
+    return max(own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def _run_case(op: str, src: str, out_dir: str, queue):
+    """Child process body: run one case and report wall time, peak RSS and output size."""
+    record = {}
+    try:
+        _, available, runner = _cases()[op]
+        if available is not None:
+            available()  # a spawned child starts fresh: apply the tool paths it resolves here too
+        start = time.perf_counter()
+        result = runner(Path(src), Path(out_dir))
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        outputs = result if isinstance(result, (list, tuple)) else [result]
+        record["output_mb"] = round(sum(_size(o) for o in outputs if o) / 1024 / 1024, 3)
+        record["status"] = "ok"
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    record["peak_rss_mb"] = round(_peak_rss_kb() / 1024, 1)
+    queue.put(record)
+
+
+def run_cases(files: dict, ops: list[str], sizes: list[int], work: Path, repeat: int = 1):
+    ctx = multiprocessing.get_context("spawn")
+    cases = _cases()
+    for op in ops:
+        kinds, available, _ = cases[op]
+        for pages in sizes:
+            for kind in kinds:
+                src = files[(kind, pages)]
+                base = {"op": op, "corpus": kind, "pages": pages, "input_mb": round(_size(src) / 1024 / 1024, 3)}
+                if available is not None and not available():
+                    yield dict(base, status="skipped", error="required binary not found")
+                    continue
+                for run in range(repeat):
+                    out_dir = work / f"{op}_{kind}_{pages}_{run}"
+                    shutil.rmtree(out_dir, ignore_errors=True)
+                    out_dir.mkdir(parents=True)
+                    queue = ctx.Queue()
+                    proc = ctx.Process(target=_run_case, args=(op, str(src), str(out_dir), queue))
+                    proc.start()
+                    proc.join()
+                    record = queue.get() if not queue.empty() else {
+                        "status": "error", "error": f"worker exited with code {proc.exitcode}"}
+                    shutil.rmtree(out_dir, ignore_errors=True)
+                    yield dict(base, run=run, **record)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _index(results: dict) -> dict:
+    """(op, corpus, pages) -> best (fastest) successful run."""
+    best = {}
+    for r in results["results"]:
+        if r.get("status") != "ok":
+            continue
+        key = (r["op"], r["corpus"], r["pages"])
+        if key not in best or r["seconds"] < best[key]["seconds"]:
+            best[key] = r
+    return best
+
+
+def compare_results(old: dict, new: dict) -> list[str]:
+    lines = [f"{'case':<32}{'old s':>9}{'new s':>9}{'time':>8}{'old MB':>9}{'new MB':>9}{'rss':>8}"]
+    old_idx, new_idx = _index(old), _index(new)
+    for key in sorted(new_idx):
+        if key not in old_idx:
+            continue
+        a, b = old_idx[key], new_idx[key]
+        dt = (b["seconds"] - a["seconds"]) / a["seconds"] * 100 if a["seconds"] else 0.0
+        dr = (b["peak_rss_mb"] - a["peak_rss_mb"]) / a["peak_rss_mb"] * 100 if a["peak_rss_mb"] else 0.0
+        lines.append(f"{'/'.join(map(str, key)):<32}{a['seconds']:>9.3f}{b['seconds']:>9.3f}{dt:>+7.1f}%"
+                     f"{a['peak_rss_mb']:>9.1f}{b['peak_rss_mb']:>9.1f}{dr:>+7.1f}%")
+    return lines
+
+
+@app.command()
+def run(
+    sizes: str = typer.Option(DEFAULT_SIZES, "--sizes", help="Comma-separated page counts, e.g. 10,100,1000"),
+    ops: str = typer.Option(None, "--ops", help="Comma-separated operations (default: all)"),
+    corpus: Path = typer.Option(Path("bench_corpus"), "--corpus", help="Where generated inputs are cached"),
+    out: Path = typer.Option(None, "--out", "-o", help="Results JSON (default: bench_<timestamp>.json)"),
+    repeat: int = typer.Option(1, "--repeat", "-n", help="Runs per case; comparisons use the fastest"),
+    baseline: Path = typer.Option(None, "--baseline", "-b", help="Earlier results JSON to compare against"),
+):
+    """Generate the corpus if needed and benchmark every operation on it."""
+    size_list = [int(s) for s in sizes.split(",") if s.strip()]
+    op_list = [o.strip() for o in ops.split(",")] if ops else list(_cases())
+    unknown = set(op_list) - set(_cases())
+    if unknown:
+        raise typer.BadParameter(f"Unknown operations: {', '.join(sorted(unknown))}")
+
+    typer.echo("Preparing corpus...")
+    files = build_corpus(corpus, size_list)
+    results = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": size_list,
+        },
+        "results": [],
+    }
+    for record in run_cases(files, op_list, size_list, corpus / "_work", repeat):
+        results["results"].append(record)
+        if record["status"] == "ok":
+            typer.echo(f"{record['op']:<14}{record['corpus']:<8}{record['pages']:>5}p  {record['seconds']:>8.3f}s"
+                       f"  {record['peak_rss_mb']:>7.1f} MB RSS  {record['output_mb']:>8.2f} MB out")
+        else:
+            typer.echo(f"{record['op']:<14}{record['corpus']:<8}{record['pages']:>5}p  {record['status']}: "
+                       f"{record.get('error')}")
+
+    out = out or Path(f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    out.write_text(json.dumps(results, indent=2))
+    typer.echo(f"Results: {out}")
+    if baseline:
+        typer.echo("\n".join(compare_results(json.loads(baseline.read_text()), results)))
+
+
+# Commands whose startup must stay fast, and modules that must not load on those paths
+STARTUP_CASES = {
+    "help": ["app.py", "--help"],
+    "merge": ["app.py", "merge", "--help"],
+    "split": ["app.py", "split", "--help"],
+}
+STARTUP_BUDGET_S = 1.0
+HEAVY_MODULES = ("fitz", "pymupdf", "pdf2docx", "pdfplumber", "pandas", "pptx", "reportlab",
+                 "pytesseract", "pdf2image", "cv2")
+
+
+def _startup_seconds(args: list[str], runs: int) -> float:
+    """Best-of-runs wall time for a fresh interpreter running args."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=Path(__file__).parent, capture_output=True, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _heavy_imports(module: str) -> list[str]:
+    code = (f"import sys; import {module}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent,
+                         capture_output=True, text=True, check=True).stdout.strip()
+    return [m for m in out.split(",") if m]
+
+
+@app.command()
+def startup(
+    budget: float = typer.Option(STARTUP_BUDGET_S, "--budget", help="Maximum seconds per command"),
+    runs: int = typer.Option(3, "--runs", "-n", help="Take the best of this many runs"),
+):
+    """Check CLI startup time and that importing app/gui leaves heavy dependencies unloaded; exits 1 on failure."""
+    failed = False
+    for name, args in STARTUP_CASES.items():
+        seconds = _startup_seconds(args, runs)
+        ok = seconds <= budget
+        failed |= not ok
+        typer.echo(f"{'ok  ' if ok else 'SLOW'} {name:<8}{seconds:>7.3f}s (budget {budget}s)")
+    for module in ("app", "gui"):
+        heavy = _heavy_imports(module)
+        failed |= bool(heavy)
+        typer.echo(f"{'ok  ' if not heavy else 'FAIL'} import {module}: "
+                   f"{'no heavy modules' if not heavy else 'loaded ' + ', '.join(heavy)}")
+    if failed:
+        raise typer.Exit(1)
+
+
+# ---------------------------------------------------------------- OCR preprocessing
+
+OCR_SAMPLE_PAGES = 6
+OCR_SAMPLE_DPI = 300
+
+
+def _ocr_sample(rng: random.Random) -> tuple:
+    """A 300 dpi scan of known text, slightly skewed and noisy, with a dark scanner edge; returns (image, text)."""
+    from PIL import Image, ImageDraw, ImageFont
+    img = Image.new("L", (2550, 3300), 235)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=36)
+    lines = [_lorem(rng, 9) for _ in range(30)]
+    for k, line in enumerate(lines):
+        draw.text((220, 260 + k * 90), line, fill=35, font=font)
+    img = img.rotate(rng.uniform(-3, 3), resample=Image.BILINEAR, fillcolor=235)
+    img = Image.blend(img, Image.effect_noise(img.size, 40), 0.12)
+    ImageDraw.Draw(img).rectangle((0, 0, rng.randrange(30, 90), img.height), fill=20)
+    return img.convert("RGB"), "\n".join(lines)
+
+
+def _word_accuracy(truth: str, text: str) -> float:
+    """Share of the true word sequence recovered, in order (1.0 = perfect)."""
+    matcher = difflib.SequenceMatcher(None, truth.split(), text.split(), autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / len(truth.split())
+
+
+@app.command("ocr-preprocess")
+def ocr_preprocess_bench(
+    presets: str = typer.Option("none,clean,fast", "--presets", help="Comma-separated preprocessing presets"),
+    pages: int = typer.Option(OCR_SAMPLE_PAGES, "--pages", "-n", help="Generated sample pages"),
+    out: Path = typer.Option(None, "--out", "-o", help="Also write the results as JSON here"),
+):
+    """Compare OCR word accuracy against Tesseract time per page for each preprocessing preset."""
+    import pdf_tools
+    from ocr_preprocess import resolve_preprocess
+
+    if not _have_tesseract():
+        typer.echo("Tesseract not found; nothing to measure.")
+        raise typer.Exit(1)
+    rng = random.Random(f"{SEED}-ocr-preprocess")
+    samples = [_ocr_sample(rng) for _ in range(pages)]
+    results = []
+    for name in (p.strip() for p in presets.split(",")):
+        config = resolve_preprocess(name)
+        seconds, scores = 0.0, []
+        for img, truth in samples:
+            start = time.perf_counter()
+            text = pdf_tools._ocr_image(img, OCR_SAMPLE_DPI, "text", "eng", config)
+            seconds += time.perf_counter() - start
+            scores.append(_word_accuracy(truth, text))
+        record = {"preset": name, "config": config, "pages": pages,
+                  "seconds_per_page": round(seconds / pages, 3),
+                  "accuracy": round(sum(scores) / pages, 4), "worst_page": round(min(scores), 4)}
+        results.append(record)
+        typer.echo(f"{name:<10}{record['seconds_per_page']:>8.3f}s/page  accuracy {record['accuracy']:.1%}"
+                   f"  (worst page {record['worst_page']:.1%})")
+    if out:
+        out.write_text(json.dumps(results, indent=2))
+
+
+@app.command()
+def compare(old: Path = typer.Argument(...), new: Path = typer.Argument(...)):
+    """Show time and peak-memory change per case between two results files."""
+    typer.echo("\n".join(compare_results(json.loads(old.read_text()), json.loads(new.read_text()))))
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    app()
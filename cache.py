@@ -0,0 +1,212 @@
+# cache.py
+import functools, hashlib, json, os, shutil, sqlite3, subprocess, threading, time
+from pathlib import Path
+
+CACHE_ROOT = Path(os.environ.get("FILETOOLBOX_CACHE", Path.home() / ".filetoolbox" / "cache"))
+RESULTS_MB = 2048
+# Restore cached outputs as hardlinks to the entry instead of copies. Cheaper, but
+# an output edited in place would edit the cache entry with it, so it's opt-in.
+RESULT_HARDLINKS = os.environ.get("FILETOOLBOX_RESULT_LINKS") == "1"
+
+_digests = {}  # (path, size, mtime_ns) -> sha256, so one process hashes a file once
+
+
+def hash_key(*parts) -> str:
+    """sha256 over length-prefixed parts, so ("ab", "c") and ("a", "bc") never collide."""
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode()
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def file_digest(path) -> str:
+    """sha256 of a file's contents, read in blocks (remembered while size and mtime stay the same)."""
+    st = os.stat(path)
+    key = (str(Path(path).resolve()), st.st_size, st.st_mtime_ns)
+    if key not in _digests:
+        with open(path, "rb") as f:
+            _digests[key] = hashlib.file_digest(f, "sha256").hexdigest()
+    return _digests[key]
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(*cmd: str) -> str:
+    """First line printed by e.g. tool_version(gs, "--version"), asked once per process."""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return "unavailable"
+    lines = (result.stdout or result.stderr).strip().splitlines()
+    return lines[0] if lines else "unknown"
+
+
+class DiskCache:
+    """
+    Content-addressed store. Entries live in a sharded directory (root/ab/cdef...),
+    an SQLite index next to them tracks size and last use for LRU eviction
+    plus persistent hit/miss counters. Safe to open from several processes, and
+    to share between threads (each thread gets its own SQLite connection).
+    """
+
+    def __init__(self, root, max_mb: float):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._local = threading.local()
+        self._db.execute("PRAGMA journal_mode=WAL")  # a property of the file, so once is enough
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, last_used REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # A connection only works on the thread that opened it, and the GUI and the
+        # service run jobs on worker threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(str(self.root / "index.sqlite"), timeout=30)
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:]
+
+    def _count(self, name: str):
+        with self._db:
+            self._db.execute(
+                "INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+            )
+
+    def get_path(self, key: str, count: bool = True) -> Path | None:
+        """Path of the entry, or None. count=False for lookups that belong to one already counted."""
+        path = self._path(key)
+        if not path.exists():
+            if count:
+                self._count("misses")
+            return None
+        with self._db:
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        if count:
+            self._count("hits")
+        return path
+
+    def get_bytes(self, key: str, count: bool = True) -> bytes | None:
+        path = self.get_path(key, count)
+        try:
+            return path.read_bytes() if path else None
+        except FileNotFoundError:  # evicted by another process in between
+            return None
+
+    def get_file(self, key: str, dest, link: bool = False) -> bool:
+        """Copy (or hardlink) the entry to dest; False if there is no such entry."""
+        path = self.get_path(key)
+        if path is None:
+            return False
+        dest = Path(dest)
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+        try:
+            if link:
+                try:
+                    os.link(path, tmp)
+                except OSError:  # other filesystem, or no hardlink support
+                    shutil.copyfile(path, tmp)
+            else:
+                shutil.copyfile(path, tmp)
+        except FileNotFoundError:  # evicted by another process in between
+            tmp.unlink(missing_ok=True)
+            return False
+        os.replace(tmp, dest)
+        return True
+
+    def put_bytes(self, key: str, data: bytes):
+        self._store(key, lambda tmp: tmp.write_bytes(data))
+
+    def put_file(self, key: str, src):
+        self._store(key, lambda tmp: shutil.copyfile(src, tmp))
+
+    def _store(self, key: str, write):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write beside the final name and rename, so readers never see half an entry
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        write(tmp)
+        os.replace(tmp, path)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, path.stat().st_size, time.time())
+            )
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the store fits in max_mb."""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        with self._db:
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._path(key).unlink(missing_ok=True)
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+
+    def stats(self) -> dict:
+        counters = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        }
+
+    def close(self):
+        """Close the calling thread's connection."""
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+_results = None
+
+
+def result_store() -> DiskCache:
+    """Per-process handle on the store of memoized operation outputs."""
+    global _results
+    if _results is None:
+        _results = DiskCache(CACHE_ROOT / "results", RESULTS_MB)
+    return _results
+
+
+def results_enabled() -> bool:
+    """False when the CLI's --no-cache (FILETOOLBOX_NO_CACHE) is in effect."""
+    return not os.environ.get("FILETOOLBOX_NO_CACHE")
+
+
+def memoized(op: str, input_path, output, params: dict, versions: dict, compute, use_cache: bool = True):
+    """
+    Produce output with compute(), or restore it from an earlier run with the same
+    operation, parameters, input content and tool versions. compute's return value
+    is kept (as JSON) with the file. Returns (value, whether it was restored).
+    """
+    if not (use_cache and results_enabled()):
+        return compute(), False
+    key = hash_key("result", op, json.dumps(params, sort_keys=True, default=str),
+                   file_digest(input_path), json.dumps(versions, sort_keys=True))
+    value_key = hash_key(key, "value")
+    store = result_store()
+    if store.get_file(key, output, link=RESULT_HARDLINKS):
+        value = store.get_bytes(value_key, count=False)
+        if value is not None:
+            return json.loads(value), True
+    value = compute()
+    store.put_file(key, output)
+    store.put_bytes(value_key, json.dumps(value, default=str).encode())
+    return value, False
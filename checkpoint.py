@@ -0,0 +1,80 @@
+# checkpoint.py
+import json, os, shutil
+from pathlib import Path
+
+
+def _write_json_atomic(path: Path, data):
+    tmp = path.with_name(path.name + ".part")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """
+    Progress record for a long page-by-page job, kept beside the output as
+    <output>.ftbjob.json (plus <output>.ftbjob.parts/ for partial results).
+
+    Every completed page is written to the manifest straight away (write and
+    rename, so a crash leaves the previous version intact). With resume=True a
+    matching manifest - same operation, input file (size and mtime) and
+    parameters - is picked up and its pages count as done; anything else starts
+    from scratch. finish() removes both once the real output is in place.
+    """
+
+    def __init__(self, output, op: str, input_path, params: dict, resume: bool = False):
+        self.path = Path(f"{output}.ftbjob.json")
+        self.parts = Path(f"{output}.ftbjob.parts")
+        st = os.stat(input_path)
+        # Round-trip through JSON so tuples vs lists don't break the comparison on resume
+        self._identity = json.loads(json.dumps({
+            "op": op,
+            "input": str(Path(input_path).resolve()),
+            "input_size": st.st_size,
+            "input_mtime": st.st_mtime,
+            "params": params,
+        }))
+        self.done = {}
+        state = self._load() if resume else None
+        if state is not None and all(state.get(k) == v for k, v in self._identity.items()):
+            self.done = {int(page): value for page, value in state.get("done", {}).items()}
+        else:
+            self.finish()
+        self.resumed = len(self.done)
+
+    def _load(self) -> dict | None:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _flush(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(self.path, dict(self._identity, done=self.done))
+
+    def is_done(self, page: int) -> bool:
+        return page in self.done
+
+    def get(self, page: int):
+        return self.done.get(page)
+
+    def forget(self, page: int):
+        """Drop a page whose recorded output turned out to be missing."""
+        self.done.pop(page, None)
+
+    def mark(self, items: dict):
+        """Record {page: value} as completed; value is anything JSON-able (e.g. an output path)."""
+        self.done.update(items)
+        self._flush()
+
+    def save_part(self, page: int, result):
+        """Store a page's intermediate result under parts/ and mark the page done."""
+        self.parts.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(self.parts / f"{page}.json", result)
+        self.mark({page: f"{page}.json"})
+
+    def load_part(self, page: int):
+        return json.loads((self.parts / self.done[page]).read_text(encoding="utf-8"))
+
+    def finish(self):
+        self.path.unlink(missing_ok=True)
+        shutil.rmtree(self.parts, ignore_errors=True)
@@ -1,9 +1,12 @@
 # gui.py
+import os
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 from pathlib import Path
-from pdf_tools import merge_pdfs, split_pdf, compress_pdf, pdf_to_docx, pdf_to_excel, pdf_to_pptx, pdf_to_images, images_to_pdf, rotate_pdf, protect_pdf, unlock_pdf, add_text_watermark, ocr_pdf
+from pdf_tools import merge_pdfs, split_pdf, compress_pdf, compress_pdf_adaptive, pdf_to_docx, pdf_to_excel, pdf_to_pptx, pdf_to_images, images_to_pdf, rotate_pdf, protect_pdf, unlock_pdf, add_text_watermark, ocr_pdf, OCR_MAX_MEMORY_MB, IMAGE_EXTS
 from office_tools import convert_with_soffice
+from jobs import JobManager, DONE, FAILED, CANCELLED
 
 class FileToolboxGUI(tk.Tk):
     def __init__(self):
@@ -11,7 +14,12 @@ class FileToolboxGUI(tk.Tk):
         self.title("FileToolbox")
         self.geometry("400x250")
         self.resizable(False, False)
+        self.jobs = JobManager(max_workers=max(2, (os.cpu_count() or 2) // 2))
+        self._job_callbacks = {}
+        self.job_window = None
         self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(250, self._poll_jobs)
 
     def create_widgets(self):
         # ---------- SCROLLABLE AREA ----------
@@ -73,7 +81,7 @@ class FileToolboxGUI(tk.Tk):
         ttk.Label(self.inner, text="PDF ↔ image", font=("Segoe UI", 11, "bold")).pack(pady=6)
         ttk.Button(self.inner, text="PDF → JPG", width=30,
            command=self.pdf_to_jpg_dialog).pack(pady=3)
-        ttk.Button(self.inner, text="JPG → PDF", width=30,
+        ttk.Button(self.inner, text="Images → PDF", width=30,
             command=self.jpg_to_pdf_dialog).pack(pady=3)
 
         ttk.Separator(self.inner, orient="horizontal").pack(fill="x", pady=8)
@@ -91,11 +99,75 @@ class FileToolboxGUI(tk.Tk):
            command=self.ocr_pdf_dialog).pack(pady=3)
 
 
+        ttk.Separator(self.inner, orient="horizontal").pack(fill="x", pady=8)
+        ttk.Button(self.inner, text="Show Jobs", width=30,
+           command=self.show_jobs).pack(pady=3)
+
         # -- add more buttons below as you implement functions --
 
         # Give mouse‑wheel scrolling
         canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(-1 * int(e.delta / 120), "units"))
 
+    # ----- Background jobs -----
+    def run_job(self, name, func, *args, on_done=None, unit="pages", hooks=True, **kwargs):
+        """Run func off the Tk thread; on_done(result) is called back on the Tk thread."""
+        job = self.jobs.submit(name, func, *args, unit=unit, hooks=hooks, **kwargs)
+        self._job_callbacks[job.id] = on_done
+        self.show_jobs()
+        return job
+
+    def show_jobs(self):
+        if self.job_window is not None and self.job_window.winfo_exists():
+            self.job_window.lift()
+            return
+        win = tk.Toplevel(self)
+        win.title("Jobs")
+        win.geometry("640x260")
+        columns = ("job", "status", "progress", "speed", "eta")
+        tree = ttk.Treeview(win, columns=columns, show="headings", height=8)
+        for col, width in zip(columns, (220, 80, 120, 110, 80)):
+            tree.heading(col, text=col.capitalize())
+            tree.column(col, width=width, anchor="w")
+        tree.pack(fill="both", expand=True, padx=6, pady=6)
+        ttk.Button(win, text="Cancel selected", command=self._cancel_selected).pack(pady=(0, 6))
+        self.job_window, self.job_tree = win, tree
+        self._refresh_jobs()
+
+    def _cancel_selected(self):
+        for item in self.job_tree.selection():
+            self.jobs.cancel(int(item))
+
+    def _refresh_jobs(self):
+        for job in self.jobs.jobs():
+            if job.total:
+                prog = f"{job.done}/{job.total} {job.unit} ({job.done * 100 // job.total}%)"
+            else:
+                prog = "-"
+            speed = f"{job.rate:.1f} {job.unit}/s" if job.rate else "-"
+            eta = f"{job.eta:.0f}s" if job.eta is not None else "-"
+            values = (job.name, job.status, prog, speed, eta)
+            if self.job_tree.exists(str(job.id)):
+                self.job_tree.item(str(job.id), values=values)
+            else:
+                self.job_tree.insert("", "end", iid=str(job.id), values=values)
+
+    def _poll_jobs(self):
+        if self.job_window is not None and self.job_window.winfo_exists():
+            self._refresh_jobs()
+        for job in self.jobs.jobs():
+            if job.id not in self._job_callbacks or job.status not in (DONE, FAILED, CANCELLED):
+                continue
+            on_done = self._job_callbacks.pop(job.id)
+            if job.status == DONE and on_done:
+                on_done(job.result)
+            elif job.status == FAILED:
+                messagebox.showerror("Error", f"{job.name}:\n{job.error}")
+        self.after(250, self._poll_jobs)
+
+    def on_close(self):
+        self.jobs.shutdown()
+        self.destroy()
+
     # ----- Actions -----
     def merge_pdfs_dialog(self):
         files = filedialog.askopenfilenames(
@@ -109,11 +181,8 @@ class FileToolboxGUI(tk.Tk):
             title="Save merged PDF as")
         if not output:
             return
-        try:
-            merge_pdfs([Path(f) for f in files], output)
-            messagebox.showinfo("Success", f"Merged PDF saved to:\n{output}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"Merge {len(files)} PDFs", merge_pdfs, [Path(f) for f in files], output, unit="files",
+                     on_done=lambda _: messagebox.showinfo("Success", f"Merged PDF saved to:\n{output}"))
 
     def split_pdf_dialog(self):
         src = filedialog.askopenfilename(
@@ -124,11 +193,9 @@ class FileToolboxGUI(tk.Tk):
         outdir = filedialog.askdirectory(title="Choose output folder for pages")
         if not outdir:
             return
-        try:
-            pages = split_pdf(Path(src), outdir)
-            messagebox.showinfo("Success", f"Created {len(pages)} separate PDFs in:\n{outdir}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"Split {Path(src).name}", split_pdf, Path(src), outdir, unit="files",
+                     on_done=lambda pages: messagebox.showinfo(
+                         "Success", f"Created {len(pages)} separate PDFs in:\n{outdir}"))
 
     def compress_pdf_dialog(self):
         input_file = filedialog.askopenfilename(
@@ -160,24 +227,32 @@ class FileToolboxGUI(tk.Tk):
         if not output_file:
             return
 
-        try:
-            compress_pdf(input_file, output_file, target_mb)
+        def done(report):
+            details = ""
+            if report is not None:
+                details = (f"\n\nSize: {report['size_mb']} MB "
+                           f"(images {report['image_dpi']} dpi, JPEG quality {report['jpeg_quality']}, "
+                           f"{report['full_passes']} full pass(es))")
             messagebox.showinfo(
                 "Success",
-                f"Compressed PDF saved to:\n{output_file}"
+                f"Compressed PDF saved to:\n{output_file}{details}"
             )
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+
+        name = f"Compress {Path(input_file).name}"
+        if target_mb is None:
+            self.run_job(name, compress_pdf, input_file, output_file, unit="passes",
+                         on_done=lambda _: done(None))
+        else:
+            self.run_job(name, compress_pdf_adaptive, input_file, output_file, target_mb, unit="passes",
+                         on_done=done)
     
     def office_convert_dialog(self, target_ext: str, filetypes):
         src = filedialog.askopenfilename(title="Choose file", filetypes=filetypes)
         if not src:
             return
-        try:
-            result = convert_with_soffice(src, target_ext)
-            messagebox.showinfo("Success", f"Saved as:\n{result}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"Convert {Path(src).name} → {target_ext}", convert_with_soffice, src, target_ext,
+                     unit="files", hooks=False,
+                     on_done=lambda result: messagebox.showinfo("Success", f"Saved as:\n{result}"))
 
     def pdf_to_word_dialog(self):
         input_file = filedialog.askopenfilename(
@@ -195,11 +270,8 @@ class FileToolboxGUI(tk.Tk):
         if not output_file:
             return
 
-        try:
-            pdf_to_docx(input_file, output_file)
-            messagebox.showinfo("Success", f"Saved Word document:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"PDF → Word {Path(input_file).name}", pdf_to_docx, input_file, output_file,
+                     on_done=lambda _: messagebox.showinfo("Success", f"Saved Word document:\n{output_file}"))
     def pdf_to_excel_dialog(self):
         input_file = filedialog.askopenfilename(
             title="Select PDF",
@@ -216,11 +288,8 @@ class FileToolboxGUI(tk.Tk):
         if not output_file:
             return
 
-        try:
-            pdf_to_excel(input_file, output_file)
-            messagebox.showinfo("Success", f"Saved Excel file:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"PDF → Excel {Path(input_file).name}", pdf_to_excel, input_file, output_file,
+                     on_done=lambda _: messagebox.showinfo("Success", f"Saved Excel file:\n{output_file}"))
     def pdf_to_pptx_dialog(self):
         input_file = filedialog.askopenfilename(
             title="Select PDF",
@@ -237,11 +306,8 @@ class FileToolboxGUI(tk.Tk):
         if not output_file:
             return
 
-        try:
-            pdf_to_pptx(input_file, output_file)
-            messagebox.showinfo("Success", f"Saved PowerPoint:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"PDF → PowerPoint {Path(input_file).name}", pdf_to_pptx, input_file, output_file,
+                     on_done=lambda _: messagebox.showinfo("Success", f"Saved PowerPoint:\n{output_file}"))
 
     def pdf_to_jpg_dialog(self):
         input_file = filedialog.askopenfilename(
@@ -257,17 +323,15 @@ class FileToolboxGUI(tk.Tk):
         if not output_folder:
             return
 
-        try:
-            image_paths = pdf_to_images(input_file, output_folder)
-            messagebox.showinfo("Success", f"Saved {len(image_paths)} images to:\n{output_folder}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"PDF → JPG {Path(input_file).name}", pdf_to_images, input_file, output_folder,
+                     on_done=lambda image_paths: messagebox.showinfo(
+                         "Success", f"Saved {len(image_paths)} images to:\n{output_folder}"))
 
 
     def jpg_to_pdf_dialog(self):
         image_files = filedialog.askopenfilenames(
-            title="Select JPG images",
-            filetypes=[("JPEG images", "*.jpg *.jpeg")],
+            title="Select images",
+            filetypes=[("Images", " ".join(f"*{ext}" for ext in IMAGE_EXTS)), ("All files", "*.*")],
             multiple=True
         )
         if not image_files:
@@ -281,11 +345,8 @@ class FileToolboxGUI(tk.Tk):
         if not output_pdf:
             return
 
-        try:
-            images_to_pdf(list(image_files), output_pdf)
-            messagebox.showinfo("Success", f"PDF created:\n{output_pdf}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"{len(image_files)} images → PDF", images_to_pdf, list(image_files), output_pdf,
+                     unit="images", on_done=lambda _: messagebox.showinfo("Success", f"PDF created:\n{output_pdf}"))
     
     def rotate_pdf_dialog(self):
         input_file = filedialog.askopenfilename(title="Select PDF", filetypes=[("PDF files", "*.pdf")])
@@ -297,11 +358,8 @@ class FileToolboxGUI(tk.Tk):
         angle = simpledialog.askinteger("Rotate", "Enter rotation angle (90, 180, 270):", minvalue=0, maxvalue=360)
         if not angle:
             return
-        try:
-            rotate_pdf(input_file, output_file, angle)
-            messagebox.showinfo("Success", f"Rotated PDF saved:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"Rotate {Path(input_file).name}", rotate_pdf, input_file, output_file, angle,
+                     on_done=lambda _: messagebox.showinfo("Success", f"Rotated PDF saved:\n{output_file}"))
 
 
     def protect_pdf_dialog(self):
@@ -314,11 +372,8 @@ class FileToolboxGUI(tk.Tk):
         password = simpledialog.askstring("Set Password", "Enter password to encrypt PDF:", show="*")
         if not password:
             return
-        try:
-            protect_pdf(input_file, output_file, password)
-            messagebox.showinfo("Success", f"Protected PDF saved:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"Protect {Path(input_file).name}", protect_pdf, input_file, output_file, password,
+                     on_done=lambda _: messagebox.showinfo("Success", f"Protected PDF saved:\n{output_file}"))
 
 
     def unlock_pdf_dialog(self):
@@ -331,11 +386,8 @@ class FileToolboxGUI(tk.Tk):
         password = simpledialog.askstring("Unlock PDF", "Enter password to decrypt PDF:", show="*")
         if not password:
             return
-        try:
-            unlock_pdf(input_file, output_file, password)
-            messagebox.showinfo("Success", f"Unlocked PDF saved:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"Unlock {Path(input_file).name}", unlock_pdf, input_file, output_file, password,
+                     on_done=lambda _: messagebox.showinfo("Success", f"Unlocked PDF saved:\n{output_file}"))
     def watermark_pdf_dialog(self):
         input_file = filedialog.askopenfilename(title="Select PDF", filetypes=[("PDF files", "*.pdf")])
         if not input_file:
@@ -346,11 +398,9 @@ class FileToolboxGUI(tk.Tk):
         watermark_text = simpledialog.askstring("Watermark Text", "Enter watermark text (e.g., CONFIDENTIAL):")
         if not watermark_text:
             return
-        try:
-            add_text_watermark(input_file, output_file, watermark_text)
-            messagebox.showinfo("Success", f"Watermarked PDF saved:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_job(f"Watermark {Path(input_file).name}", add_text_watermark, input_file, output_file,
+                     watermark_text,
+                     on_done=lambda _: messagebox.showinfo("Success", f"Watermarked PDF saved:\n{output_file}"))
     
     def ocr_pdf_dialog(self):
         input_file = filedialog.askopenfilename(title="Select scanned PDF", filetypes=[("PDF files", "*.pdf")])
@@ -359,11 +409,18 @@ class FileToolboxGUI(tk.Tk):
         output_file = filedialog.asksaveasfilename(title="Save searchable PDF", defaultextension=".pdf")
         if not output_file:
             return
-        try:
-            ocr_pdf(input_file, output_file)
-            messagebox.showinfo("Success", f"OCR complete. Saved PDF:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        workers = simpledialog.askinteger("OCR workers", "Number of parallel OCR workers:",
+                                          initialvalue=os.cpu_count() or 1, minvalue=1, parent=self)
+        if not workers:
+            return
+        max_memory = simpledialog.askinteger("Memory limit", "Maximum memory for page images (MB):",
+                                             initialvalue=OCR_MAX_MEMORY_MB, minvalue=64, parent=self)
+        if not max_memory:
+            return
+        self.run_job(f"OCR {Path(input_file).name}", ocr_pdf, input_file, output_file,
+                     workers=workers, max_memory_mb=max_memory,
+                     on_done=lambda _: messagebox.showinfo("Success", f"OCR complete. Saved PDF:\n{output_file}"))
     
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     FileToolboxGUI().mainloop()
@@ -0,0 +1,128 @@
+# inspect_tools.py
+"""
+Quick profile of a PDF: page count, which pages have text, images and their
+effective resolution, fonts, encryption, and which pages could hold a ruled
+table. Profiles are kept in a small on-disk index keyed by the file's content
+hash, so operations can look one up before deciding what work to do.
+"""
+import json, os
+
+from cache import CACHE_ROOT, DiskCache, file_digest
+
+PROFILE_VERSION = 1     # bump when the profile layout or heuristics change
+PROFILE_INDEX_MB = 32
+TABLE_MIN_PATHS = 4     # ruling operators before a page counts as a likely table
+
+_index = None
+
+
+def profile_index() -> DiskCache:
+    """Per-process handle on the on-disk profile index."""
+    global _index
+    if _index is None:
+        _index = DiskCache(CACHE_ROOT / "profiles", PROFILE_INDEX_MB)
+    return _index
+
+
+def _image_dpi(info: dict) -> int | None:
+    x0, y0, x1, y1 = info["bbox"]
+    if x1 - x0 <= 0 or y1 - y0 <= 0:
+        return None
+    # Lowest of the two axes: what downsampling would be judged against
+    return round(min(info["width"] / ((x1 - x0) / 72), info["height"] / ((y1 - y0) / 72)))
+
+
+def profile_pdf(path) -> dict:
+    """Profile a PDF without the index. Encrypted files only report their page count."""
+    import fitz
+    from pdf_tools import _PATH_OPS, _may_have_grid
+
+    profile = {"version": PROFILE_VERSION, "size": os.path.getsize(path)}
+    with fitz.open(path) as doc:
+        profile["pages"] = doc.page_count
+        profile["encrypted"] = bool(doc.needs_pass)
+        if doc.needs_pass:
+            profile["page_info"] = None
+            return profile
+
+        fonts = {}
+        page_info = []
+        for page in doc:
+            for xref, ext, kind, basefont, *_ in doc.get_page_fonts(page.number):
+                fonts.setdefault(xref, {"name": basefont, "type": kind, "embedded": ext != "n/a"})
+            dpis = [d for d in map(_image_dpi, page.get_image_info()) if d]
+            grid = _may_have_grid(page)
+            page_info.append({
+                "chars": len(page.get_text("text").strip()),
+                "images": len(page.get_images()),
+                "min_image_dpi": min(dpis, default=None),
+                "max_image_dpi": max(dpis, default=None),
+                "grid": grid,
+                "ruling_ops": len(_PATH_OPS.findall(page.read_contents())) if grid else 0,
+            })
+    profile["page_info"] = page_info
+    profile["fonts"] = sorted(fonts.values(), key=lambda f: f["name"])
+    return profile
+
+
+def document_profile(path, refresh: bool = False) -> dict:
+    """The profile of path from the index, profiling (and indexing) it first if needed."""
+    digest = file_digest(path)
+    key = f"pdf-{PROFILE_VERSION}-{digest}"
+    index = profile_index()
+    if not refresh:
+        cached = index.get_bytes(key)
+        if cached is not None:
+            return json.loads(cached)
+    profile = dict(profile_pdf(path), sha256=digest)
+    index.put_bytes(key, json.dumps(profile).encode())
+    return profile
+
+
+def text_pages(profile: dict) -> list[int] | None:
+    """1-based pages that already have a text layer; None if the profile can't tell."""
+    info = profile["page_info"]
+    return None if info is None else [i + 1 for i, p in enumerate(info) if p["chars"]]
+
+
+def image_count(profile: dict) -> int | None:
+    info = profile["page_info"]
+    return None if info is None else sum(p["images"] for p in info)
+
+
+def table_pages(profile: dict, min_ruling_ops: int = 0) -> list[int] | None:
+    """
+    0-based pages that could hold a ruled table (they draw lines/rectangles or use
+    form XObjects); min_ruling_ops narrows that to pages drawing at least that many.
+    """
+    info = profile["page_info"]
+    if info is None:
+        return None
+    return [i for i, p in enumerate(info) if p["grid"] and p["ruling_ops"] >= min_ruling_ops]
+
+
+def summary(profile: dict) -> dict:
+    """Document-level view of a profile, as shown by `app.py inspect`."""
+    result = {
+        "pages": profile["pages"],
+        "size_mb": round(profile["size"] / (1024 * 1024), 2),
+        "encrypted": profile["encrypted"],
+        "sha256": profile.get("sha256"),
+    }
+    info = profile["page_info"]
+    if info is None:
+        return result
+    dpis = [p["min_image_dpi"] for p in info if p["min_image_dpi"]]
+    likely = table_pages(profile, TABLE_MIN_PATHS)
+    result.update({
+        "text_pages": len(text_pages(profile)),
+        "pages_without_text": profile["pages"] - len(text_pages(profile)),
+        "images": image_count(profile),
+        "image_dpi_range": [min(dpis), max(p["max_image_dpi"] for p in info if p["max_image_dpi"])] if dpis else None,
+        "fonts": len(profile["fonts"]),
+        "unembedded_fonts": [f["name"] for f in profile["fonts"] if not f["embedded"]],
+        "table_candidate_pages": len(table_pages(profile)),
+        "likely_table_pages": len(likely),
+        "table_likelihood": round(len(likely) / profile["pages"], 2) if profile["pages"] else 0.0,
+    })
+    return result
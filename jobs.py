@@ -0,0 +1,111 @@
+# jobs.py
+import itertools, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_tools import OperationCancelled
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class Job:
+    """One submitted operation plus the progress it has reported so far."""
+
+    def __init__(self, job_id: int, name: str, unit: str):
+        self.id = job_id
+        self.name = name
+        self.unit = unit
+        self.status = QUEUED
+        self.done = 0
+        self.total = 0
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    def _progress(self, done: int, total: int):
+        self.done, self.total = done, total
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self) -> float:
+        """Units (pages, files, ...) per second so far."""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        if self.status != RUNNING or not self.rate or not self.total:
+            return None
+        return (self.total - self.done) / self.rate
+
+
+class JobManager:
+    """
+    Runs operations on a background thread pool so the caller (the Tk main loop)
+    never blocks. Each job's function is called with progress= and cancel=
+    keyword arguments, matching the hooks in pdf_tools.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ftb-job")
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, func, *args, unit: str = "pages", hooks: bool = True, **kwargs) -> Job:
+        """
+        Queue func(*args, **kwargs). With hooks=False the function is called without
+        progress/cancel (for operations that don't support them; they can't be stopped mid-run).
+        """
+        job = Job(next(self._ids), name, unit)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, func, args, kwargs, hooks)
+        return job
+
+    def _run(self, job: Job, func, args, kwargs, hooks: bool):
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            job.finished = job.finished or time.monotonic()
+            return
+        job.status = RUNNING
+        job.started = time.monotonic()
+        try:
+            if hooks:
+                kwargs = dict(kwargs, progress=job._progress, cancel=job.cancel_event)
+            job.result = func(*args, **kwargs)
+            job.status = DONE
+        except OperationCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished = time.monotonic()
+
+    def cancel(self, job_id: int):
+        job = self._jobs.get(job_id)
+        if job is not None and job.status in (QUEUED, RUNNING):
+            job.cancel_event.set()
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished = time.monotonic()
+
+    def forget(self, job_id: int):
+        """Drop a finished job's record (its result and error go with it)."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def jobs(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self):
+        for job in self.jobs():
+            self.cancel(job.id)
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,11 @@
 # office_tools.py
-import subprocess, shutil, tempfile, os
+import itertools, subprocess, shutil, tempfile, os, signal, queue, threading, time
+from concurrent.futures import Future
 from pathlib import Path
 
+from cache import memoized, tool_version
+from telemetry import path_bytes, span
+
 def _soffice_path() -> str:
     # 1) If bundled portable copy exists, use it
     portable = Path(__file__).with_name("bin") / "LibreOffice" / "program" / "soffice.exe"
@@ -13,28 +17,239 @@ def _soffice_path() -> str:
         raise RuntimeError("LibreOffice (soffice) not found. Install it or bundle a portable copy.")
     return exe
 
-def convert_with_soffice(src: str, target_ext: str) -> str:
+SOFFICE_TIMEOUT = 180  # seconds per document
+SOFFICE_STARTUP = 30   # extra allowance for a launch to get going before its first document
+SOFFICE_BATCH = 20      # documents handed to one soffice launch
+PROFILE_ROOT = Path(tempfile.gettempdir()) / "filetoolbox-soffice"
+
+
+def _lock_file(f) -> bool:
+    """Take an exclusive, non-blocking OS lock on an open file; the OS drops it if the process dies."""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _claim_profile():
+    """
+    (profile dir, lock file) for the first profile slot no other worker holds,
+    in this or any other process. Two soffice instances on one profile hand
+    their work to each other and exit, so a profile is never shared.
+    """
+    PROFILE_ROOT.mkdir(parents=True, exist_ok=True)
+    for n in itertools.count():
+        f = open(PROFILE_ROOT / f"worker{n}.lock", "a+b")
+        if _lock_file(f):
+            return PROFILE_ROOT / f"worker{n}", f
+        f.close()
+
+
+def _run_soffice(cmd: list[str], timeout: float, out_dir: Path | None = None,
+                 startup: float = 0.0) -> subprocess.CompletedProcess:
+    """
+    Run soffice in its own process group so a hung instance can be killed with its children.
+    timeout is per document: with out_dir, the deadline moves on whenever a new output
+    appears there, so a batch is given up on once it stalls, however many documents it has.
+    """
+    if os.name == "nt":
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                start_new_session=True)
+    produced = 0
+    deadline = time.monotonic() + startup + timeout
+    while True:
+        try:
+            # Retrying communicate() after a timeout loses no output
+            out, err = proc.communicate(timeout=max(0.0, min(1.0, deadline - time.monotonic())))
+            break
+        except subprocess.TimeoutExpired:
+            if out_dir is not None:
+                count = sum(1 for _ in out_dir.iterdir())
+                if count > produced:
+                    produced, deadline = count, time.monotonic() + timeout
+            if time.monotonic() < deadline:
+                continue
+            if os.name == "nt":
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+            proc.communicate()
+            raise
+    return subprocess.CompletedProcess(cmd, proc.returncode, out, err)
+
+
+class SofficePool:
+    """
+    A pool of headless LibreOffice workers fed from a job queue.
+
+    Each worker holds a persistent user profile (-env:UserInstallation) under a
+    lock for as long as it runs, so several instances - across pools and
+    processes too - can run side by side and only the first launch of a profile
+    pays for creating it. A worker drains up to SOFFICE_BATCH queued jobs into a
+    single soffice launch; if that launch crashes, or goes a whole per-document
+    timeout without finishing another document, it is killed and the documents
+    it didn't finish are retried one by one.
+    """
+
+    def __init__(self, workers: int | None = None, timeout: float = SOFFICE_TIMEOUT,
+                 batch_size: int = SOFFICE_BATCH):
+        self.soffice = _soffice_path()
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._jobs = queue.Queue()
+        self._threads = []
+        for _ in range(workers or min(4, os.cpu_count() or 1)):
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, src: str, target_ext: str, outdir: str | None = None) -> Future:
+        """Queue one conversion; the future resolves to the output path."""
+        fut = Future()
+        self._jobs.put((Path(src).resolve(), target_ext, outdir, fut))
+        return fut
+
+    def convert_many(self, srcs: list[str], target_ext: str, outdir: str | None = None) -> list[str]:
+        futures = [self.submit(s, target_ext, outdir) for s in srcs]
+        return [f.result() for f in futures]
+
+    def close(self):
+        for _ in self._threads:
+            self._jobs.put(None)
+        for t in self._threads:
+            t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _worker(self):
+        profile, lock = _claim_profile()
+        try:
+            self._work(profile)
+        finally:
+            lock.close()  # releases the profile
+
+    def _work(self, profile: Path):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            batch = [job]
+            while len(batch) < self.batch_size:
+                try:
+                    nxt = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:  # shutting down, leave the sentinel for this thread's next get()
+                    self._jobs.put(None)
+                    break
+                batch.append(nxt)
+            for group in self._group(batch):
+                try:
+                    self._convert(profile, group)
+                except Exception as e:
+                    for job in group:
+                        if not job[3].done():
+                            job[3].set_exception(e)
+
+    @staticmethod
+    def _group(batch):
+        """Split a batch so every soffice launch has one target format and unique file stems."""
+        groups = []
+        for job in batch:
+            for group in groups:
+                if group[0][1] == job[1] and group[0][2] == job[2] and all(j[0].stem != job[0].stem for j in group):
+                    group.append(job)
+                    break
+            else:
+                groups.append([job])
+        return groups
+
+    def _convert(self, profile: Path, group: list):
+        target_ext = group[0][1]
+        out_ext = target_ext.split(":")[0]
+        out_dir = Path(tempfile.mkdtemp(prefix="ftb-soffice-"))
+        cmd = [
+            self.soffice, f"-env:UserInstallation={profile.resolve().as_uri()}",
+            "--headless", "--norestore", "--convert-to", target_ext, "--outdir", str(out_dir),
+            *(str(job[0]) for job in group),
+        ]
+        try:
+            with span("subprocess", tool="soffice", docs=len(group),
+                      bytes_in=path_bytes([job[0] for job in group])) as s:
+                result = _run_soffice(cmd, self.timeout, out_dir, SOFFICE_STARTUP)
+                s["returncode"] = result.returncode
+            error = (result.stderr.strip() or result.stdout.strip()) if result.returncode != 0 else None
+        except subprocess.TimeoutExpired:
+            error = f"LibreOffice made no progress for {self.timeout:.0f}s"
+
+        for job in group:
+            src_path, _, outdir, fut = job
+            produced = out_dir / f"{src_path.stem}.{out_ext}"
+            if produced.exists():
+                final_dir = Path(outdir) if outdir else src_path.parent
+                final_path = final_dir / produced.name
+                shutil.move(str(produced), final_path)
+                fut.set_result(str(final_path))
+            elif len(group) > 1:
+                # The launch crashed or hung part-way: retry the leftovers in a fresh instance
+                self._convert(profile, [job])
+            elif error:
+                fut.set_exception(RuntimeError(f"LibreOffice failed:\n{error}"))
+            else:
+                fut.set_exception(RuntimeError(f"Conversion failed – output not produced.\n"
+                                               f"Tried to create: {produced}"))
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> SofficePool:
+    """Process-wide pool, started on first use and kept warm for later conversions."""
+    global _default_pool
+    with _default_pool_lock:  # concurrent first calls (e.g. service jobs) must not start two pools
+        if _default_pool is None:
+            _default_pool = SofficePool()
+    return _default_pool
+
+
+def convert_with_soffice(src: str, target_ext: str, outdir: str | None = None, use_cache: bool = True) -> str:
     """
     Convert a document to another format using LibreOffice headless.
     Example: DOCX -> PDF  or  PDF -> DOCX
+    The result is written beside the source unless outdir is given.
+    With use_cache, converting a byte-identical document again with the same
+    LibreOffice version restores the earlier result instead of launching soffice.
     """
-    soffice = _soffice_path()
     src_path = Path(src).resolve()
-    out_dir = Path(tempfile.mkdtemp())
-    cmd = [
-        soffice, "--headless", "--convert-to", target_ext, "--outdir", str(out_dir), str(src_path)
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"LibreOffice failed:\n{result.stderr.strip() or result.stdout.strip()}")
-
-    # LibreOffice keeps the same base filename, only extension changes
-    output_file = out_dir / f"{src_path.stem}.{target_ext}"
-    if not output_file.exists():
-        raise RuntimeError(f"Conversion failed – output not produced.\n"
-                        f"Tried to create: {output_file}")
-
-    # Move beside source (or wherever caller wants later)
-    final_path = src_path.with_suffix(f".{target_ext}")
-    output_file.replace(final_path)
-    return str(final_path)
+    out = (Path(outdir) if outdir else src_path.parent) / f"{src_path.stem}.{target_ext.split(':')[0]}"
+    with span("convert_with_soffice", bytes_in=path_bytes(src)) as s:
+        # The input's extension picks LibreOffice's import filter, so it is part of the key
+        _, s["cached"] = memoized(
+            "convert_with_soffice", src_path, out, {"target_ext": target_ext, "suffix": src_path.suffix.lower()},
+            {"soffice": tool_version(_soffice_path(), "--version")},
+            lambda: default_pool().submit(src, target_ext, outdir).result(), use_cache,
+        )
+        s["bytes_out"] = path_bytes(out)
+    return str(out)
+
+
+def convert_many_with_soffice(srcs: list[str], target_ext: str, workers: int | None = None,
+                              outdir: str | None = None) -> list[str]:
+    """Convert many documents at once across a pool of LibreOffice instances."""
+    with SofficePool(workers) as pool:
+        return pool.convert_many(srcs, target_ext, outdir)
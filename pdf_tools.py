@@ -1,131 +1,1068 @@
 # pdf_tools.py
+import importlib, os, re, sqlite3
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
+from telemetry import path_bytes, span, traced
+from checkpoint import Checkpoint
+from inspect_tools import document_profile, image_count, table_pages, text_pages
 
-def merge_pdfs(paths, output):
+
+class _Lazy:
+    """
+    Stand-in for a heavy module (or one name from it) that is imported on first use,
+    so e.g. `app.py split` never pays for pdf2docx, PyMuPDF or Tesseract.
+    on_load(module) runs once, right after the import.
+    """
+
+    def __init__(self, module: str, attr: str | None = None, on_load=None):
+        self._module, self._attr, self._on_load = module, attr, on_load
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            module = importlib.import_module(self._module)
+            if self._on_load is not None:
+                self._on_load(module)
+            self._target = getattr(module, self._attr) if self._attr else module
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+
+class OperationCancelled(Exception):
+    """Raised inside an operation once its cancel event has been set."""
+
+
+def _check(progress, cancel, done: int, total: int):
+    """
+    Progress/cancellation hook shared by the operations below.
+    progress(done, total) is called with units of work (usually pages);
+    cancel is a threading.Event-like object checked at the same points.
+    """
+    if cancel is not None and cancel.is_set():
+        raise OperationCancelled("Cancelled")
+    if progress is not None:
+        progress(done, total)
+
+
+def _pool_results(func, arg_list: list[tuple], workers: int, cancel=None):
+    """
+    Run func(*args) for each args in a process pool and yield results in submission order.
+    Waiting polls the cancel event; on cancel or error the queued work is dropped.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers)
+    futures = [pool.submit(func, *args) for args in arg_list]
+    try:
+        for fut in futures:
+            while True:
+                try:
+                    result = fut.result(timeout=0.25)
+                    break
+                except FuturesTimeout:
+                    _check(None, cancel, 0, 0)
+            yield result
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+
+def _write_pdf(writer: PdfWriter, path):
+    """Serialize a pypdf writer to path, traced as its own stage."""
+    with span("pdf.write") as s:
+        with open(path, "wb") as f:
+            writer.write(f)
+        s["bytes_out"] = os.path.getsize(path)
+
+
+def _page_windows(pages: list[int], chunk: int):
+    """Split sorted 1-based page numbers into contiguous (first, last) windows of at most chunk pages."""
+    first = prev = None
+    for p in pages:
+        if first is not None and (p != prev + 1 or p - first >= chunk):
+            yield first, prev
+            first = None
+        if first is None:
+            first = p
+        prev = p
+    if first is not None:
+        yield first, prev
+
+
+def _profile(path) -> dict | None:
+    """The indexed profile of path (see inspect_tools), or None if it can't be profiled."""
+    try:
+        with span("pdf.profile"):
+            return document_profile(path)
+    # A file fitz can't parse (FileDataError is a RuntimeError), an unreadable file,
+    # or a locked/read-only index: the caller just does the full amount of work
+    except (OSError, RuntimeError, ValueError, sqlite3.OperationalError):
+        return None
+
+
+def parse_page_ranges(spec: str, n_pages: int) -> list[int]:
+    """
+    '1-3,7,9-' -> zero-based page indices [0, 1, 2, 6, 8, ..., n_pages-1].
+    Pages are 1-based in the spec; open-ended ranges run to the last page.
+    """
+    pages = []
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        start, sep, end = part.partition("-")
+        first = int(start) if start else 1
+        last = (int(end) if end else n_pages) if sep else first
+        if not 1 <= first <= last <= n_pages:
+            raise ValueError(f"Page range '{part}' is outside 1-{n_pages}")
+        pages.extend(range(first - 1, last))
+    return pages
+
+
+def split_page_spec(item) -> tuple[str, str | None]:
+    """'a.pdf:1-10' -> ('a.pdf', '1-10'); plain paths (including C:\\...) have no spec."""
+    m = re.match(r"^(.+):([\d,\- ]+)$", str(item))
+    if m:
+        return m.group(1), m.group(2)
+    return str(item), None
+
+
+@traced("merge_pdfs")
+def merge_pdfs(paths, output, dedupe: bool = True, progress=None, cancel=None):
+    """
+    Merge PDFs into one. Each input may select pages as 'file.pdf:1-10,15'.
+    Bookmarks of the selected pages are kept. With dedupe, identical objects
+    (fonts, images, ...) shared between inputs are written only once.
+    """
     writer = PdfWriter()
-    for path in paths:
-        reader = PdfReader(str(path))
-        for page in reader.pages:
-            writer.add_page(page)
-    with open(output, "wb") as f:
-        writer.write(f)
+    for i, item in enumerate(paths):
+        _check(progress, cancel, i, len(paths))
+        path, spec = split_page_spec(item)
+        reader = PdfReader(path)
+        pages = parse_page_ranges(spec, len(reader.pages)) if spec else None
+        # append() copies the objects into the writer, so each reader can go right away
+        writer.append(reader, pages=pages, import_outline=True)
+        del reader
+    if dedupe:
+        writer.compress_identical_objects()
+    _write_pdf(writer, output)
+    _check(progress, None, len(paths), len(paths))
     return output
 
-def split_pdf(src, output_dir):
-    reader = PdfReader(str(src))
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
+SPLIT_MODES = ("pages", "ranges", "every", "bookmarks", "size")
+RESOURCE_KINDS = ("/Font", "/XObject", "/ExtGState", "/ColorSpace", "/Pattern", "/Shading", "/Properties")
+
+
+def _used_names(page) -> set[bytes]:
+    contents = page.get_contents()
+    data = contents.get_data() if contents is not None else b""
+    return set(re.findall(rb"/([^\s/\[\]<>(){}%]+)", data))
+
+
+def _prune_resources(page):
+    """
+    Give the page its own /Resources holding only names its content stream mentions,
+    so the writer never copies fonts/images the page doesn't draw.
+    """
+    res = page.get("/Resources")
+    if res is None:
+        return
+    res = res.get_object()
+    used = _used_names(page)
+    pruned = DictionaryObject()
+    for key, value in res.items():
+        value = value.get_object() if key in RESOURCE_KINDS else value
+        if key in RESOURCE_KINDS and isinstance(value, DictionaryObject):
+            value = DictionaryObject(
+                {NameObject(k): v for k, v in value.items() if k[1:].encode() in used}
+            )
+        pruned[NameObject(key)] = value
+    page[NameObject("/Resources")] = pruned
+
+
+def _stream_bytes(obj, seen: set, depth: int = 0) -> int:
+    """Encoded size of every not-yet-counted stream reachable from obj."""
+    if depth > 6:
+        return 0
+    if isinstance(obj, IndirectObject):
+        if obj.idnum in seen:
+            return 0
+        seen.add(obj.idnum)
+    obj = obj.get_object()
+    total = 0
+    if isinstance(obj, StreamObject):
+        total += len(obj._data or b"")
+    if isinstance(obj, DictionaryObject):
+        for key, value in obj.items():
+            if key != "/Parent":
+                total += _stream_bytes(value, seen, depth + 1)
+    elif isinstance(obj, ArrayObject):
+        for value in obj:
+            total += _stream_bytes(value, seen, depth + 1)
+    return total
+
 
+def _size_groups(reader, max_bytes: int) -> list[list[int]]:
+    """Greedy page groups whose estimated size (shared resources counted once) stays under max_bytes."""
+    groups, current, seen, size = [], [], set(), 0
+    for i, page in enumerate(reader.pages):
+        _prune_resources(page)
+        page_seen = set(seen)
+        cost = _stream_bytes(page.get("/Contents"), page_seen) + _stream_bytes(page.get("/Resources"), page_seen)
+        if current and size + cost > max_bytes:
+            groups.append(current)
+            current, seen, size = [], set(), 0
+            page_seen = set()
+            cost = _stream_bytes(page.get("/Contents"), page_seen) + _stream_bytes(page.get("/Resources"), page_seen)
+        current.append(i)
+        seen = page_seen
+        size += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _bookmark_groups(reader) -> list[tuple[str, list[int]]]:
+    starts = []
+    for item in reader.outline:
+        if isinstance(item, list):  # children of the previous entry
+            continue
+        page_no = reader.get_destination_page_number(item)
+        if page_no is not None and page_no >= 0:
+            starts.append((page_no, item.title))
+    starts.sort(key=lambda s: s[0])
+    if not starts:
+        raise ValueError("PDF has no bookmarks to split on.")
+    n = len(reader.pages)
+    groups = []
+    if starts[0][0] > 0:
+        groups.append(("front", list(range(0, starts[0][0]))))
+    for k, (start, title) in enumerate(starts):
+        end = starts[k + 1][0] if k + 1 < len(starts) else n
+        if end > start:
+            safe = re.sub(r"[^\w\- ]+", "", title).strip().replace(" ", "_")[:60] or "section"
+            groups.append((f"{k + 1:02d}_{safe}", list(range(start, end))))
+    return groups
+
+
+def _split_groups(reader, mode: str, ranges: str | None, every: int | None,
+                  max_mb: float | None) -> list[tuple[str, list[int]]]:
+    n = len(reader.pages)
+    if mode == "pages":
+        return [(f"page{i + 1}", [i]) for i in range(n)]
+    if mode == "every":
+        if not every or every < 1:
+            raise ValueError("Split every N pages needs N >= 1.")
+        return [(f"part{k + 1}", list(range(s, min(s + every, n)))) for k, s in enumerate(range(0, n, every))]
+    if mode == "ranges":
+        if not ranges:
+            raise ValueError("Split by ranges needs a range list like '1-3,4-10'.")
+        groups = []
+        for part in ranges.replace(" ", "").split(","):
+            pages = parse_page_ranges(part, n)
+            groups.append((f"pages{pages[0] + 1}-{pages[-1] + 1}", pages))
+        return groups
+    if mode == "bookmarks":
+        return _bookmark_groups(reader)
+    if mode == "size":
+        if not max_mb:
+            raise ValueError("Split by size needs max_mb.")
+        return [(f"part{k + 1}", g) for k, g in enumerate(_size_groups(reader, int(max_mb * 1024 * 1024)))]
+    raise ValueError(f"Unknown split mode: {mode}")
+
+
+def _write_split_batch(src: str, batch: list[tuple[str, list[int]]], prune: bool) -> list[str]:
+    # Runs in a worker process with its own reader
+    reader = PdfReader(src)
     outputs = []
-    for i, page in enumerate(reader.pages, 1):
+    for out_path, pages in batch:
         writer = PdfWriter()
-        writer.add_page(page)
-        out_path = output_dir / f"{Path(src).stem}_page{i}.pdf"
-        with open(out_path, "wb") as f:
-            writer.write(f)
+        for i in pages:
+            page = reader.pages[i]
+            if prune:
+                _prune_resources(page)
+            writer.add_page(page)
+        _write_pdf(writer, out_path)
         outputs.append(out_path)
     return outputs
 
-import tempfile, os, subprocess, shutil
-from pathlib import Path
 
-def compress_pdf(input_pdf, output_pdf, target_mb: float | None = None):
+@traced("split_pdf")
+def split_pdf(src, output_dir, mode: str = "pages", ranges: str | None = None, every: int | None = None,
+              max_mb: float | None = None, prune: bool = True, workers: int | None = None,
+              progress=None, cancel=None):
     """
-    Compress PDF with Ghostscript.
-    If target_mb is given, try qualities in order until size <= target_mb.
+    Split a PDF into several files.
+    mode: "pages" (one file per page), "ranges" ('1-3,4-10': one file per range),
+    "every" (every N pages), "bookmarks" (one file per top-level bookmark) or
+    "size" (files of at most max_mb, estimated).
+    With prune, each output keeps only the resources its pages actually use.
+    Outputs are written from a process pool and returned in order.
     """
-    qualities = ["screen", "ebook", "printer", "prepress"]  # weakest → strongest
-    if target_mb is None:
-        qualities = ["ebook"]  # default single pass
+    reader = PdfReader(str(src))
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    groups = _split_groups(reader, mode, ranges, every, max_mb)
+    stem = Path(src).stem
+    jobs = [(str(output_dir / f"{stem}_{name}.pdf"), pages) for name, pages in groups]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    # Contiguous batches so each worker reads a nearby part of the file,
+    # a few per worker so progress moves steadily
+    size = -(-len(jobs) // (workers * 4))
+    batches = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    outputs = []
+    _check(progress, cancel, 0, len(jobs))
+    for result in _pool_results(_write_split_batch, [(str(src), b, prune) for b in batches], workers, cancel):
+        outputs.extend(result)
+        _check(progress, cancel, len(outputs), len(jobs))
+    return [Path(p) for p in outputs]
+
+import tempfile, os, subprocess, shutil, threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache import memoized, tool_version
 
+# Quality ladder for target-size compression, lowest -> highest quality:
+# (image resolution in dpi, JPEG quality)
+COMPRESS_LADDER = [
+    (50, 30), (72, 40), (96, 50), (120, 60), (150, 70),
+    (200, 75), (250, 80), (300, 85), (300, 92),
+]
+COMPRESS_SAMPLE_PAGES = 8
+COMPRESS_CHUNK_TIMEOUT = 900  # seconds one Ghostscript process may spend on a chunk
+
+
+def _gs_path() -> str:
     LOCAL_GS = Path(__file__).with_name("bin") / "gswin64c.exe"
     gs_path = str(LOCAL_GS) if LOCAL_GS.exists() else shutil.which("gswin64c") or shutil.which("gs")
     if not gs_path:
         raise RuntimeError("Ghostscript not found.")
+    return gs_path
+
+
+def _gs_version() -> dict:
+    return {"gs": tool_version(_gs_path(), "--version")}
+
+
+def _gs_quality_args(dpi: int, jpeg_q: int) -> list[str]:
+    return [
+        "-dPDFSETTINGS=/ebook",
+        "-dDownsampleColorImages=true", "-dDownsampleGrayImages=true", "-dDownsampleMonoImages=true",
+        "-dColorImageDownsampleType=/Bicubic", "-dGrayImageDownsampleType=/Bicubic",
+        "-dColorImageDownsampleThreshold=1.0", "-dGrayImageDownsampleThreshold=1.0",
+        f"-dColorImageResolution={dpi}", f"-dGrayImageResolution={dpi}",
+        f"-dMonoImageResolution={dpi * 2}",
+        "-dAutoFilterColorImages=false", "-dAutoFilterGrayImages=false",
+        "-dColorImageFilter=/DCTEncode", "-dGrayImageFilter=/DCTEncode",
+        f"-dJPEGQ={jpeg_q}",
+    ]
+
+
+def _run_gs(quality_args: list[str], in_path, out_path, timeout: float | None = None, on_start=None):
+    """Run one pdfwrite pass; on_start(proc) is called once Ghostscript is running (so it can be killed)."""
+    cmd = [
+        _gs_path(),
+        "-sDEVICE=pdfwrite",
+        "-dCompatibilityLevel=1.4",
+        *quality_args,
+        "-dNOPAUSE",
+        "-dQUIET",
+        "-dBATCH",
+        f"-sOutputFile={out_path}",
+        str(in_path),
+    ]
+    with span("subprocess", tool="gs", bytes_in=path_bytes(in_path)) as s:
+        proc = subprocess.Popen(cmd)
+        if on_start is not None:
+            on_start(proc)
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, cmd)
+        s["bytes_out"] = path_bytes(out_path)
+
 
+def _temp_pdf() -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmpf:
+        return tmpf.name
+
+
+def _copy_as_is(src, dest):
+    """Copy src to dest unchanged; nothing to do when they are the same file (e.g. in-place pipeline steps)."""
+    if Path(src).resolve() != Path(dest).resolve():
+        shutil.copyfile(src, dest)
+
+
+def _write_sample(in_path: Path, n_pages: int) -> str:
+    """Evenly spaced subset of pages, used to estimate compressed size cheaply."""
+    reader = PdfReader(str(in_path))
+    total = len(reader.pages)
+    step = total / n_pages
+    writer = PdfWriter()
+    for i in range(n_pages):
+        writer.add_page(reader.pages[int(i * step)])
+    sample = _temp_pdf()
+    _write_pdf(writer, sample)
+    return sample
+
+
+def _estimate_sizes(in_path: Path, ladder: list[tuple]) -> list[float]:
+    """Estimated full-document size (bytes) for each ladder rung, from a sampled subset run in parallel."""
+    total_pages = len(PdfReader(str(in_path)).pages)
+    full_size = os.path.getsize(in_path)
+    sampled = total_pages > COMPRESS_SAMPLE_PAGES
+    sample = _write_sample(in_path, COMPRESS_SAMPLE_PAGES) if sampled else str(in_path)
+    sample_size = os.path.getsize(sample)
+
+    def run(rung):
+        out = _temp_pdf()
+        try:
+            _run_gs(_gs_quality_args(*rung), sample, out)
+            return os.path.getsize(out)
+        finally:
+            os.remove(out)
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(ladder), os.cpu_count() or 1)) as pool:
+            sizes = list(pool.map(run, ladder))
+    finally:
+        if sampled:
+            os.remove(sample)
+    return [s * full_size / sample_size for s in sizes]
+
+
+@traced("compress_pdf_adaptive")
+def compress_pdf_adaptive(input_pdf, output_pdf, target_mb: float, ladder: list[tuple] | None = None,
+                          use_cache: bool = True, progress=None, cancel=None) -> dict:
+    """
+    Compress to the highest quality that still fits in target_mb.
+    Every ladder rung is tried on a sample of pages in parallel to estimate the
+    final size; full-document passes then search the ladder, rescaling the
+    estimates after each pass by how far off they were.
+    Returns a report with the chosen settings and the number of full passes.
+    A file already under target_mb is copied as-is (full_passes 0). With use_cache,
+    a run identical to an earlier one (same input bytes, target, ladder and
+    Ghostscript version) restores that run's output and report instead.
+    """
+    ladder = ladder or COMPRESS_LADDER
     in_path = Path(input_pdf)
     out_path = Path(output_pdf)
+    target = target_mb * 1024 * 1024
 
-    for q in qualities:
-        # write to a temp file first
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmpf:
-            tmp_name = tmpf.name
-
-        cmd = [
-            gs_path,
-            "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            f"-dPDFSETTINGS=/{q}",
-            "-dNOPAUSE",
-            "-dQUIET",
-            "-dBATCH",
-            f"-sOutputFile={tmp_name}",
-            str(in_path),
-        ]
-        subprocess.run(cmd, check=True)
-
-        # If no target given, accept the first result (ebook)
-        if target_mb is None:
-            shutil.move(tmp_name, out_path)
-            return out_path
-
-        size_mb = os.path.getsize(tmp_name) / (1024 * 1024)
-        if size_mb <= target_mb:
-            shutil.move(tmp_name, out_path)
-            return out_path
-        else:
-            os.remove(tmp_name)  # too large, try next quality
+    profile = _profile(in_path)
+    if profile is not None and profile["size"] <= target:
+        # Already fits: Ghostscript could only make it worse
+        _copy_as_is(in_path, out_path)
+        _check(progress, None, 1, 1)
+        size_mb = round(profile["size"] / (1024 * 1024), 2)
+        return {"output": str(out_path), "image_dpi": None, "jpeg_quality": None,
+                "estimated_mb": size_mb, "size_mb": size_mb, "full_passes": 0}
+    if profile is not None and image_count(profile) == 0:
+        # The rungs differ only in image settings, so without images they all come out the same
+        ladder = ladder[-1:]
 
-    # If we exit the loop, even strongest quality is still too big
-    raise RuntimeError(
-        "Could not reach target size. "
-        "Try a larger target or optimize the PDF manually."
+    report, cached = memoized(
+        "compress_pdf_adaptive", in_path, out_path, {"target_mb": target_mb, "ladder": ladder}, _gs_version(),
+        lambda: _compress_to_target(in_path, out_path, target, ladder, progress, cancel), use_cache,
     )
+    if cached:
+        _check(progress, None, 1, 1)
+    return dict(report, output=str(out_path))
+
+
+def _compress_to_target(in_path: Path, out_path: Path, target: float, ladder: list[tuple],
+                        progress, cancel) -> dict:
+    # Progress counts Ghostscript passes: the sample round plus about log2(ladder) full passes
+    # (usually fewer; capped so a longer search doesn't overshoot)
+    max_passes = 1 + len(ladder).bit_length()
+    _check(progress, cancel, 0, max_passes)
+    estimates = _estimate_sizes(in_path, ladder)
+    _check(progress, cancel, 1, max_passes)
+    fitting = [i for i, est in enumerate(estimates) if est <= target]
+    best = fitting[-1] if fitting else 0
+
+    passes = 0
+    chosen = None
+    lo, hi = 0, len(ladder) - 1
+    candidate = best
+    while lo <= hi:
+        tmp_name = _temp_pdf()
+        try:
+            _run_gs(_gs_quality_args(*ladder[candidate]), in_path, tmp_name)
+            passes += 1
+            size = os.path.getsize(tmp_name)
+            _check(progress, cancel, min(1 + passes, max_passes - 1), max_passes)
+        except BaseException:  # Ghostscript failed or the run was cancelled: leave no temp files
+            os.remove(tmp_name)
+            if chosen is not None:
+                os.remove(chosen[1])
+            raise
+        if size <= target:
+            if chosen is not None:
+                os.remove(chosen[1])
+            chosen = (candidate, tmp_name, size)
+            lo = candidate + 1
+        else:
+            os.remove(tmp_name)
+            hi = candidate - 1
+        # Rescale the estimates by how far off they were for this rung. Once a rung fits
+        # and no better one is predicted to, that's the answer; otherwise try the best
+        # rung still predicted to fit (bisecting only when none is)
+        ratio = size / estimates[candidate] if estimates[candidate] else 1.0
+        fits = [i for i in range(lo, hi + 1) if estimates[i] * ratio <= target]
+        if chosen and not fits:
+            break
+        candidate = fits[-1] if fits else (lo + hi) // 2
+
+    if chosen is None:
+        raise RuntimeError(
+            "Could not reach target size. "
+            "Try a larger target or optimize the PDF manually."
+        )
+    rung, tmp_name, size = chosen
+    shutil.move(tmp_name, out_path)
+    _check(progress, None, max_passes, max_passes)
+    dpi, jpeg_q = ladder[rung]
+    return {
+        "output": str(out_path),
+        "image_dpi": dpi,
+        "jpeg_quality": jpeg_q,
+        "estimated_mb": round(estimates[rung] / (1024 * 1024), 2),
+        "size_mb": round(size / (1024 * 1024), 2),
+        "full_passes": passes,
+    }
+
+
+def _copy_outline(reader: PdfReader, writer: PdfWriter, items=None, parent=None):
+    """Rebuild reader's bookmarks in writer, whose pages are reader's pages in the same order."""
+    last = parent
+    for item in reader.outline if items is None else items:
+        if isinstance(item, list):  # children of the item before
+            _copy_outline(reader, writer, item, last)
+            continue
+        page = reader.get_destination_page_number(item)
+        last = writer.add_outline_item(item.title, page, parent) if page is not None else parent
+
+
+def _check_page_order(reader: PdfReader, writer: PdfWriter):
+    """Reassembled pages must match the source one for one (Ghostscript may turn a page, so size is compared unordered)."""
+    if len(writer.pages) != len(reader.pages):
+        raise RuntimeError(f"Reassembled PDF has {len(writer.pages)} pages, source has {len(reader.pages)}.")
+    for i, (src, out) in enumerate(zip(reader.pages, writer.pages)):
+        a = sorted((float(src.cropbox.width), float(src.cropbox.height)))
+        b = sorted((float(out.cropbox.width), float(out.cropbox.height)))
+        if abs(a[0] - b[0]) > 1 or abs(a[1] - b[1]) > 1:
+            raise RuntimeError(f"Page {i + 1} of the reassembled PDF doesn't match the source page.")
+
+
+def _compress_chunked(input_pdf, out_path: Path, quality_args: list[str], chunk_pages: int,
+                      workers: int | None, timeout: float, progress, cancel):
+    reader = PdfReader(str(input_pdf))
+    n_pages = len(reader.pages)
+    windows = list(_page_windows(list(range(1, n_pages + 1)), chunk_pages))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(windows)))
+    tmp_dir = tempfile.mkdtemp(prefix="ftb_gs_")
+    running, lock, stopping = set(), threading.Lock(), threading.Event()
+
+    def started(proc):
+        with lock:
+            running.add(proc)
+            if stopping.is_set():  # launched while the others were being killed
+                proc.kill()
+
+    def kill_running():
+        with lock:
+            stopping.set()
+            for proc in running:
+                if proc.poll() is None:
+                    proc.kill()
+
+    def run(k: int) -> str:
+        first, last = windows[k]
+        part = os.path.join(tmp_dir, f"chunk{k}.pdf")
+        try:
+            # Every process reads the whole input but only interprets and writes its own pages.
+            # Whole fonts instead of per-chunk subsets, so the copies come out identical and merge below
+            _run_gs([*quality_args, "-dSubsetFonts=false", f"-dFirstPage={first}", f"-dLastPage={last}"],
+                    input_pdf, part, timeout, started)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"Ghostscript took longer than {timeout:g}s on pages {first}-{last}.")
+        return part
+
+    try:
+        _check(progress, cancel, 0, len(windows))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run, k) for k in range(len(windows))]
+            try:
+                for done, fut in enumerate(as_completed(futures), 1):
+                    fut.result()
+                    _check(progress, cancel, done, len(windows))
+            except BaseException:
+                for fut in futures:
+                    fut.cancel()
+                kill_running()  # don't wait out the chunks still running
+                raise
+
+        writer = PdfWriter()
+        for k, (first, last) in enumerate(windows):
+            part = PdfReader(os.path.join(tmp_dir, f"chunk{k}.pdf"))
+            if len(part.pages) != last - first + 1:
+                raise RuntimeError(f"Ghostscript returned {len(part.pages)} pages for pages {first}-{last}.")
+            writer.append(part, import_outline=False)
+        _check_page_order(reader, writer)
+        _copy_outline(reader, writer)
+        if reader.metadata:
+            writer.add_metadata(reader.metadata)
+        # Chunks embed their own copies of shared fonts, profiles and repeated images
+        # (fonts are embedded whole above, so their programs are byte-identical)
+        writer.compress_identical_objects()
+        _write_pdf(writer, out_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@traced("compress_pdf")
+def compress_pdf(input_pdf, output_pdf, target_mb: float | None = None, chunk_pages: int | None = None,
+                 workers: int | None = None, use_cache: bool = True, progress=None, cancel=None):
+    """
+    Compress PDF with Ghostscript. A file with no images is copied unchanged.
+    If target_mb is given, pick the best quality that fits (see compress_pdf_adaptive).
+    With chunk_pages, the default pass runs as one Ghostscript process per chunk
+    of pages, workers at a time (each limited to COMPRESS_CHUNK_TIMEOUT), and the
+    chunks are joined with identical objects merged, the page count and sizes
+    checked against the source, and bookmarks and metadata restored.
+    With use_cache, a byte-identical input compressed before with the same
+    Ghostscript version gets the earlier output back without running it.
+    """
+    if target_mb is not None:
+        if chunk_pages:
+            raise ValueError("chunk_pages applies to the default pass, not to target_mb.")
+        return Path(compress_pdf_adaptive(input_pdf, output_pdf, target_mb, use_cache=use_cache,
+                                          progress=progress, cancel=cancel)["output"])
+
+    # default single pass
+    _check(progress, cancel, 0, 1)
+    out_path = Path(output_pdf)
+    profile = _profile(input_pdf)
+    if profile is not None and image_count(profile) == 0:
+        # /ebook works by downsampling images; with none there is nothing to gain
+        _copy_as_is(input_pdf, out_path)
+        _check(progress, None, 1, 1)
+        return out_path
 
-from pdf2docx import Converter
+    def run():
+        tmp_name = _temp_pdf()
+        try:
+            if chunk_pages:
+                _compress_chunked(input_pdf, tmp_name, ["-dPDFSETTINGS=/ebook"], chunk_pages, workers,
+                                  COMPRESS_CHUNK_TIMEOUT, progress, cancel)
+            else:
+                _run_gs(["-dPDFSETTINGS=/ebook"], Path(input_pdf), tmp_name)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+        shutil.move(tmp_name, out_path)
 
-def pdf_to_docx(input_pdf: str, output_docx: str):
+    params = {"settings": "/ebook", "chunk_pages": chunk_pages}
+    memoized("compress_pdf", input_pdf, out_path, params, _gs_version(), run, use_cache)
+    _check(progress, None, 1, 1)
+    return out_path
+
+Converter = _Lazy("pdf2docx", "Converter")
+import logging, time
+
+DOCX_PAGES_PER_TASK = 10
+
+
+def _docx_parse_chunk(input_pdf: str, pages: list[int], json_path: str) -> dict:
+    """
+    Parse one chunk of pages with pdf2docx and serialize the layout to json_path.
+    The chunk is analysed as a whole (fonts, sections) but pages are parsed one
+    at a time so each gets its own timing. Returns {page_no: seconds}.
+    """
     cv = Converter(input_pdf)
-    cv.convert(output_docx, start=0, end=None)
-    cv.close()
+    settings = cv.default_settings
+    try:
+        cv.load_pages()
+        chunk = set(pages)
+        for page in cv.pages:
+            page.skip_parsing = page.id not in chunk
+        cv.parse_document(**settings)
+
+        timings = {}
+        for page_no in pages:
+            for page in cv.pages:
+                page.skip_parsing = page.id != page_no
+            start = time.perf_counter()
+            cv.parse_pages(**settings)
+            timings[page_no] = time.perf_counter() - start
+        cv.serialize(json_path)
+    finally:
+        cv.close()
+    return timings
+
+
+@traced("pdf_to_docx")
+def pdf_to_docx(input_pdf: str, output_docx: str, workers: int | None = None,
+                pages_per_chunk: int = DOCX_PAGES_PER_TASK, use_cache: bool = True,
+                progress=None, cancel=None) -> dict:
+    """
+    Convert PDF to Word, parsing page chunks on separate cores and assembling
+    one DOCX at the end. If the pool fails (worker crash, out of memory) the
+    remaining chunks are parsed in this process instead.
+    With use_cache, a byte-identical input converted before with the same
+    pdf2docx/PyMuPDF versions gets the earlier DOCX (and report) back.
+    Returns {"output", "workers", "fallback", "page_seconds": {page_no: s}} (1-based pages).
+    """
+    from importlib.metadata import version
+    # Chunking and worker count don't change the document, so they stay out of the key
+    versions = {"pdf2docx": version("pdf2docx"), "pymupdf": version("PyMuPDF")}
+    report, cached = memoized(
+        "pdf_to_docx", input_pdf, output_docx, {}, versions,
+        lambda: _convert_docx(input_pdf, output_docx, workers, pages_per_chunk, progress, cancel), use_cache,
+    )
+    if cached:
+        # The stored report came through JSON, which turned page numbers into strings
+        report["page_seconds"] = {int(k): v for k, v in report["page_seconds"].items()}
+        _check(progress, None, 1, 1)
+    return dict(report, output=output_docx)
+
+
+def _convert_docx(input_pdf: str, output_docx: str, workers: int | None, pages_per_chunk: int,
+                  progress, cancel) -> dict:
+    with fitz.open(input_pdf) as doc:
+        n_pages = doc.page_count
+    chunks = [list(range(i, min(i + pages_per_chunk, n_pages))) for i in range(0, n_pages, pages_per_chunk)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(chunks) or 1))
+
+    timings = {}
+    fallback = False
+    _check(progress, cancel, 0, n_pages)
+    with tempfile.TemporaryDirectory(prefix="ftb_docx_") as tmp:
+        jobs = [(input_pdf, chunk, os.path.join(tmp, f"chunk{k}.json")) for k, chunk in enumerate(chunks)]
+
+        def collect(results):
+            for chunk_timings in results:
+                timings.update(chunk_timings)
+                _check(progress, cancel, len(timings), n_pages)
+
+        try:
+            if workers > 1:
+                collect(_pool_results(_docx_parse_chunk, jobs, workers, cancel))
+            else:
+                collect(_docx_parse_chunk(*job) for job in jobs)
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            logging.warning("Parallel PDF → Word failed (%s); continuing serially", e)
+            fallback = True
+            collect(_docx_parse_chunk(*job) for job in jobs if job[1][0] not in timings)
+
+        cv = Converter(input_pdf)
+        try:
+            settings = cv.default_settings
+            cv.load_pages()
+            for _, _, json_path in jobs:
+                cv.deserialize(json_path)
+            cv.make_docx(output_docx, **settings)
+        finally:
+            cv.close()
+
+    _check(progress, None, n_pages, n_pages)
+    return {
+        "output": output_docx,
+        "workers": workers,
+        "fallback": fallback,
+        "page_seconds": {page_no + 1: round(s, 3) for page_no, s in sorted(timings.items())},
+    }
 
-import pdfplumber
-import pandas as pd
+import csv
+pdfplumber = _Lazy("pdfplumber")
 
-def pdf_to_excel(input_pdf: str, output_excel: str):
-    with pdfplumber.open(input_pdf) as pdf:
-        all_tables = []
+TABLE_PAGES_PER_TASK = 25
+TABLE_FORMATS = (".xlsx", ".csv", ".parquet")
+_PATH_OPS = re.compile(rb"(?:^|\s)(?:re|l)\s")
+
+
+def _may_have_grid(page) -> bool:
+    """
+    Cheap pre-filter on the raw content stream: pdfplumber's default table finder
+    only sees ruling lines, so a page that never draws a line or rectangle
+    (and has no form XObjects that could) cannot contain a table.
+    """
+    if _PATH_OPS.search(page.read_contents()):
+        return True
+    return bool(page.get_xobjects())
+
+
+def _extract_tables_range(input_pdf: str, pages: list[int]) -> list[tuple[int, list]]:
+    # Runs in a worker process: one pdfplumber handle for the whole range
+    results = []
+    with pdfplumber.open(input_pdf, pages=[p + 1 for p in pages]) as pdf:
         for page in pdf.pages:
-            tables = page.extract_tables()
-            for table in tables:
-                all_tables.append(pd.DataFrame(table))
+            tables = sorted(page.find_tables(), key=lambda t: (t.bbox[1], t.bbox[0]))
+            results.append((page.page_number - 1, [t.extract() for t in tables]))
+            page.close()
+    return results
 
-    if not all_tables:
-        raise ValueError("No tables found in the PDF.")
 
-    # Write all tables to one Excel file with multiple sheets
-    with pd.ExcelWriter(output_excel, engine="openpyxl") as writer:
-        for i, df in enumerate(all_tables):
-            df.to_excel(writer, sheet_name=f"Table{i+1}", index=False, header=False)
+class _TableSink:
+    """Writes tables row by row; the current table can be extended by a continuation."""
+
+    def __init__(self, output: str):
+        self.output = Path(output)
+        self.fmt = self.output.suffix.lower()
+        if self.fmt not in TABLE_FORMATS:
+            raise ValueError(f"Unsupported table output: {self.fmt} (use {', '.join(TABLE_FORMATS)})")
+        self.count = 0
+        self.paths = []
+        self._current = None
+        if self.fmt == ".xlsx":
+            from openpyxl import Workbook
+            self._wb = Workbook(write_only=True)  # rows go straight to disk-backed XML
+        elif self.fmt == ".parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow).")
+
+    def start_table(self, rows: list[list]):
+        self._close_current()
+        self.count += 1
+        if self.fmt == ".xlsx":
+            self._current = self._wb.create_sheet(f"Table{self.count}")
+        elif self.fmt == ".csv":
+            path = self.output.with_name(f"{self.output.stem}_table{self.count}.csv")
+            self.paths.append(path)
+            f = open(path, "w", newline="", encoding="utf-8")
+            self._current = (f, csv.writer(f))
+        else:
+            path = self.output.with_name(f"{self.output.stem}_table{self.count}.parquet")
+            self.paths.append(path)
+            self._current = [path, None, len(rows[0]) if rows else 0]
+        self.extend_table(rows)
+
+    def extend_table(self, rows: list[list]):
+        if self.fmt == ".xlsx":
+            for row in rows:
+                self._current.append(row)
+        elif self.fmt == ".csv":
+            self._current[1].writerows(rows)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            path, writer, ncols = self._current
+            cols = {f"col{i}": [str(r[i]) if i < len(r) and r[i] is not None else None for r in rows]
+                    for i in range(ncols)}
+            batch = pa.table(cols, schema=pa.schema([(c, pa.string()) for c in cols]))
+            if writer is None:
+                writer = self._current[1] = pq.ParquetWriter(str(path), batch.schema)
+            writer.write_table(batch)
+
+    def _close_current(self):
+        if self._current is None:
+            return
+        if self.fmt == ".csv":
+            self._current[0].close()
+        elif self.fmt == ".parquet" and self._current[1] is not None:
+            self._current[1].close()
+        self._current = None
+
+    def close(self) -> list[Path]:
+        self._close_current()
+        if self.fmt == ".xlsx":
+            if self.count:
+                self._wb.save(str(self.output))
+            self.paths = [self.output]
+        return self.paths
+
+
+@traced("pdf_to_excel")
+def pdf_to_excel(input_pdf: str, output_excel: str, workers: int | None = None, stitch: bool = False,
+                 prefilter: bool = True, progress=None, cancel=None):
+    """
+    Extract every table into one sheet each (.xlsx), or one file per table (.csv / .parquet).
+    Pages are scanned in parallel ranges; with prefilter, pages that never draw
+    a line (per the document profile index) are skipped without parsing. With stitch, a table that ends a page and
+    continues at the top of the next page (same column count) becomes one sheet,
+    dropping a repeated header row. Rows are streamed to the output, so memory
+    stays flat on very large reports.
+    """
+    profile = _profile(input_pdf) if prefilter else None
+    if profile is not None and profile["page_info"] is not None:
+        n_pages, candidates = profile["pages"], table_pages(profile)
+    else:
+        with fitz.open(input_pdf) as doc:
+            n_pages = doc.page_count
+            candidates = [p.number for p in doc if not prefilter or _may_have_grid(p)]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, -(-len(candidates) // TABLE_PAGES_PER_TASK) or 1))
+    chunks = [candidates[i:i + TABLE_PAGES_PER_TASK] for i in range(0, len(candidates), TABLE_PAGES_PER_TASK)]
+
+    sink = _TableSink(output_excel)
+    last = None  # (page_no, ncols, header) of the table at the bottom of the previous page
+    done = n_pages - len(candidates)
+    _check(progress, cancel, done, n_pages)
+    try:
+        for page_results in _pool_results(_extract_tables_range, [(input_pdf, c) for c in chunks],
+                                          workers, cancel):
+            for page_no, tables in page_results:
+                for k, rows in enumerate(tables):
+                    if not rows:
+                        continue
+                    ncols = len(rows[0])
+                    continues = (stitch and k == 0 and last is not None
+                                 and last[0] == page_no - 1 and last[1] == ncols)
+                    if continues:
+                        if rows[0] == last[2]:
+                            rows = rows[1:]  # header repeated on the new page
+                        sink.extend_table(rows)
+                    else:
+                        sink.start_table(rows)
+                        header = rows[0]
+                    last = (page_no, ncols, last[2] if continues else header)
+                if not tables:
+                    last = None
+                done += 1
+                _check(progress, cancel, done, n_pages)
+    finally:
+        paths = sink.close()
+
+    if not sink.count:
+        raise ValueError("No tables found in the PDF.")
+    _check(progress, None, n_pages, n_pages)
+    return str(paths[0]) if sink.fmt == ".xlsx" else [str(p) for p in paths]
 
-import fitz  # PyMuPDF
-from pptx import Presentation
-from pptx.util import Inches
-from PIL import Image
 import io
+fitz = _Lazy("fitz")  # PyMuPDF
+Presentation = _Lazy("pptx", "Presentation")
+Inches = _Lazy("pptx.util", "Inches")
+Image = _Lazy("PIL.Image")
+
+RENDER_DPI = 150
+RENDER_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+
+def _encode_pixmap(pix, fmt: str, quality: int) -> bytes:
+    if fmt == "png":
+        return pix.tobytes("png")
+    img = Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples)
+    buf = io.BytesIO()
+    img.save(buf, RENDER_FORMATS[fmt], quality=quality)
+    return buf.getvalue()
+
+
+def _write_atomic(path: Path, data: bytes):
+    # A page file either exists complete or not at all, so reruns can trust it
+    tmp = path.with_name(path.name + ".part")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _render_range(input_pdf: str, first: int, last: int, opts: dict) -> list:
+    # Runs in a worker process with its own fitz.Document
+    doc = fitz.open(input_pdf)
+    colorspace = fitz.csGRAY if opts["grayscale"] else fitz.csRGB
+    fmt, quality = opts["fmt"], opts["quality"]
+    results = []
+    for pno in range(first, last):
+        page = doc[pno]
+        data = _encode_pixmap(page.get_pixmap(dpi=opts["dpi"], colorspace=colorspace, alpha=False), fmt, quality)
+        thumb = None
+        if opts["thumbnail"]:
+            scale = opts["thumbnail"] / max(page.rect.width, page.rect.height)
+            tpix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=colorspace, alpha=False)
+            thumb = _encode_pixmap(tpix, fmt, quality)
+        if opts["output_folder"] is None:
+            results.append((data, thumb))
+            continue
+        out_path = Path(opts["output_folder"]) / _page_image_name(pno + 1, opts["n_pages"], fmt)
+        _write_atomic(out_path, data)
+        if thumb is not None:
+            _write_atomic(out_path.parent / "thumbs" / out_path.name, thumb)
+        results.append(str(out_path))
+    doc.close()
+    return results
+
+
+def _page_image_name(page_no: int, n_pages: int, fmt: str) -> str:
+    # Zero-padded so names sort in page order and are known before rendering
+    return f"page_{page_no:0{len(str(n_pages))}d}.{fmt}"
+
+
+def render_pages(input_pdf: str, dpi: int = RENDER_DPI, fmt: str = "jpg", quality: int = 85,
+                 grayscale: bool = False, thumbnail: int = 0, output_folder: str | None = None,
+                 workers: int | None = None, checkpoint: Checkpoint | None = None,
+                 progress=None, cancel=None) -> list:
+    """
+    Render every page, splitting page ranges across a process pool.
+    With output_folder, pages are written as page_NNN.<fmt> (thumbnails under thumbs/)
+    and the paths are returned; otherwise (image_bytes, thumbnail_bytes) pairs.
+    Results are always in page order. thumbnail is the longest thumbnail edge in pixels.
+    With a checkpoint (output_folder only), pages it lists whose file still exists
+    are not rendered again, and each finished range is recorded in it.
+    """
+    fmt = fmt.lower()
+    if fmt not in RENDER_FORMATS:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    with fitz.open(input_pdf) as doc:
+        n_pages = doc.page_count
+    if output_folder is not None:
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+        if thumbnail:
+            (Path(output_folder) / "thumbs").mkdir(exist_ok=True)
+
+    done = {}
+    if checkpoint is not None:
+        for page_no, path in list(checkpoint.done.items()):
+            if Path(path).exists():
+                done[page_no] = path
+            else:
+                checkpoint.forget(page_no)
+    todo = [n for n in range(1, n_pages + 1) if n not in done]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+    # A few ranges per worker keeps the pool busy when some pages are slower
+    chunk = max(1, -(-len(todo) // (workers * 4)))
+    ranges = [(first - 1, last) for first, last in _page_windows(todo, chunk)]
+    opts = {
+        "dpi": dpi, "fmt": fmt, "quality": quality, "grayscale": grayscale, "thumbnail": thumbnail,
+        "output_folder": str(output_folder) if output_folder is not None else None, "n_pages": n_pages,
+    }
+    results = dict(done)
+    _check(progress, cancel, len(results), n_pages)
+    for (first, last), result in zip(ranges, _pool_results(
+            _render_range, [(input_pdf, first, last, opts) for first, last in ranges], workers, cancel)):
+        rendered = dict(zip(range(first + 1, last + 1), result))
+        results.update(rendered)
+        if checkpoint is not None:
+            checkpoint.mark(rendered)
+        _check(progress, cancel, len(results), n_pages)
+    return [results[n] for n in range(1, n_pages + 1)]
 
-def pdf_to_pptx(input_pdf: str, output_pptx: str):
-    pdf = fitz.open(input_pdf)
+
+@traced("pdf_to_pptx")
+def pdf_to_pptx(input_pdf: str, output_pptx: str, dpi: int = RENDER_DPI, workers: int | None = None,
+                progress=None, cancel=None):
     prs = Presentation()
 
     # Set slide dimensions to match typical screen
     prs.slide_width = Inches(10)
     prs.slide_height = Inches(7.5)
 
-    for page in pdf:
-        pix = page.get_pixmap(dpi=150)
-        img_bytes = pix.tobytes("png")
+    for img_bytes, _ in render_pages(input_pdf, dpi=dpi, fmt="png", workers=workers,
+                                     progress=progress, cancel=cancel):
         image_stream = io.BytesIO(img_bytes)
 
         slide = prs.slides.add_slide(prs.slide_layouts[6])  # blank slide
@@ -133,124 +1070,896 @@ def pdf_to_pptx(input_pdf: str, output_pptx: str):
 
     prs.save(output_pptx)
 
-from PIL import Image
 
-def pdf_to_images(input_pdf: str, output_folder: str):
-    pdf = fitz.open(input_pdf)
-    output_paths = []
+@traced("pdf_to_images")
+def pdf_to_images(input_pdf: str, output_folder: str, dpi: int = RENDER_DPI, fmt: str = "jpg",
+                  quality: int = 85, grayscale: bool = False, thumbnail: int = 0,
+                  workers: int | None = None, resume: bool = False, progress=None, cancel=None):
+    """
+    Write every page as an image into output_folder. Finished pages are recorded
+    in <output_folder>.ftbjob.json; with resume, a killed run picks up where it stopped.
+    """
+    params = {"dpi": dpi, "fmt": fmt.lower(), "quality": quality, "grayscale": grayscale, "thumbnail": thumbnail}
+    checkpoint = Checkpoint(output_folder, "pdf_to_images", input_pdf, params, resume=resume)
+    paths = render_pages(input_pdf, dpi=dpi, fmt=fmt, quality=quality, grayscale=grayscale,
+                         thumbnail=thumbnail, output_folder=output_folder, workers=workers,
+                         checkpoint=checkpoint, progress=progress, cancel=cancel)
+    checkpoint.finish()
+    return paths
+
+
+import zlib
+ImageSequence = _Lazy("PIL.ImageSequence")
+
+PAGE_SIZES = {"a4": (595.28, 841.89), "letter": (612.0, 792.0), "legal": (612.0, 1008.0), "a3": (841.89, 1190.55)}
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".gif", ".webp")
+
+
+class ImagePdfWriter:
+    """
+    Streams images into a PDF one at a time, so memory stays flat no matter
+    how many images are added. Baseline RGB/grayscale JPEGs are embedded
+    as-is (DCTDecode passthrough); everything else is decoded once and stored
+    losslessly with Flate.
+
+    page_size: None keeps the image's own size, or "A4"/"letter"/... to fit it on that page.
+    target_dpi: downsample images whose effective resolution on the page is higher.
+    """
+
+    def __init__(self, output_pdf: str, page_size: str | None = None, target_dpi: int | None = None,
+                 jpeg_quality: int = 85):
+        if page_size is not None and page_size.lower() not in PAGE_SIZES:
+            raise ValueError(f"Unknown page size: {page_size}")
+        self.page_size = PAGE_SIZES[page_size.lower()] if page_size else None
+        self.target_dpi = target_dpi
+        self.jpeg_quality = jpeg_quality
+        self._f = open(output_pdf, "wb")
+        self._offsets = {}
+        self._kids = []
+        self._next_id = 3  # 1 = catalog, 2 = page tree (written last)
+        self._f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    def _write_obj(self, num: int, body: bytes, stream: bytes | None = None):
+        self._offsets[num] = self._f.tell()
+        self._f.write(b"%d 0 obj\n" % num + body)
+        if stream is not None:
+            self._f.write(b"\nstream\n" + stream + b"\nendstream")
+        self._f.write(b"\nendobj\n")
+
+    def _layout(self, width_px: int, height_px: int, dpi: float):
+        """Page size and image placement (all in points) for an image of the given size."""
+        img_w, img_h = width_px * 72 / dpi, height_px * 72 / dpi
+        if self.page_size is None:
+            return img_w, img_h, (0, 0, img_w, img_h)
+        page_w, page_h = self.page_size
+        if (img_w > img_h) != (page_w > page_h):
+            page_w, page_h = page_h, page_w
+        scale = min(page_w / img_w, page_h / img_h)
+        w, h = img_w * scale, img_h * scale
+        return page_w, page_h, ((page_w - w) / 2, (page_h - h) / 2, w, h)
+
+    def _needs_downsample(self, width_px: int, width_pt: float) -> bool:
+        return bool(self.target_dpi) and width_px / (width_pt / 72) > self.target_dpi
+
+    def _downsample(self, img, width_pt: float):
+        if not self._needs_downsample(img.width, width_pt):
+            return img
+        ratio = self.target_dpi / (img.width / (width_pt / 72))
+        return img.resize((max(1, round(img.width * ratio)), max(1, round(img.height * ratio))), Image.LANCZOS)
+
+    def _add_page(self, width: int, height: int, colorspace: bytes, filt: bytes, data: bytes, dpi: float):
+        page_w, page_h, (x, y, w, h) = self._layout(width, height, dpi)
+        img_id, content_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+        self._write_obj(img_id, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                                b"/ColorSpace /%s /BitsPerComponent 8 /Filter /%s /Length %d >>"
+                        % (width, height, colorspace, filt, len(data)), data)
+        content = b"q %.4f 0 0 %.4f %.4f %.4f cm /Im0 Do Q" % (w, h, x, y)
+        self._write_obj(content_id, b"<< /Length %d >>" % len(content), content)
+        self._write_obj(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] "
+                                 b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                        % (page_w, page_h, img_id, content_id))
+        self._kids.append(page_id)
+
+    def add_image(self, path: str):
+        with Image.open(path) as img:
+            dpi = float(img.info.get("dpi", (72, 72))[0] or 72) if self.page_size is None else 72.0
+            if dpi < 10:  # some writers store a placeholder resolution of 1
+                dpi = 72.0
+            width_pt = self._layout(img.width, img.height, dpi)[2][2]
+            passthrough = (
+                img.format == "JPEG" and img.mode in ("RGB", "L")
+                and not self._needs_downsample(img.width, width_pt)
+            )
+            if passthrough:
+                colorspace = b"DeviceRGB" if img.mode == "RGB" else b"DeviceGray"
+                self._add_page(img.width, img.height, colorspace, b"DCTDecode", Path(path).read_bytes(), dpi)
+                return
+            # Multi-frame images (TIFF, GIF) become one page per frame, decoded one at a time
+            for frame in ImageSequence.Iterator(img):
+                self._add_decoded(frame, dpi, reencode_jpeg=img.format == "JPEG")
 
-    for i, page in enumerate(pdf):
-        pix = page.get_pixmap(dpi=150)
-        output_path = os.path.join(output_folder, f"page_{i+1}.jpg")
-        pix.save(output_path)
-        output_paths.append(output_path)
+    def _add_decoded(self, frame, dpi: float, reencode_jpeg: bool):
+        width_pt = self._layout(frame.width, frame.height, dpi)[2][2]
+        if frame.mode in ("RGBA", "LA", "P", "PA"):
+            rgba = frame.convert("RGBA")
+            frame = Image.new("RGB", rgba.size, "white")
+            frame.paste(rgba, mask=rgba.getchannel("A"))
+        elif frame.mode not in ("RGB", "L"):
+            frame = frame.convert("L" if frame.mode in ("1", "I", "I;16", "F") else "RGB")
+        frame = self._downsample(frame, width_pt)
+        if self.page_size is None:
+            # Fewer pixels over the same page width
+            dpi = frame.width * 72 / width_pt
+        colorspace = b"DeviceRGB" if frame.mode == "RGB" else b"DeviceGray"
+        if reencode_jpeg:
+            buf = io.BytesIO()
+            frame.save(buf, "JPEG", quality=self.jpeg_quality)
+            self._add_page(frame.width, frame.height, colorspace, b"DCTDecode", buf.getvalue(), dpi)
+        else:
+            self._add_page(frame.width, frame.height, colorspace, b"FlateDecode",
+                           zlib.compress(frame.tobytes(), 6), dpi)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % k for k in self._kids)
+        self._write_obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._kids)))
+        xref = self._f.tell()
+        size = self._next_id
+        self._f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for num in range(1, size):
+            self._f.write(b"%010d 00000 n \n" % self._offsets[num])
+        self._f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+        self._f.close()
+
+    def __enter__(self):
+        return self
 
-    return output_paths
+    def __exit__(self, *exc):
+        self.close()
 
 
-def images_to_pdf(image_paths: list[str], output_pdf: str):
+@traced("images_to_pdf")
+def images_to_pdf(image_paths: list[str], output_pdf: str, page_size: str | None = None,
+                  target_dpi: int | None = None, progress=None, cancel=None):
     if not image_paths:
         raise ValueError("No images selected.")
-    
-    images = [Image.open(p).convert("RGB") for p in image_paths]
-    images[0].save(output_pdf, save_all=True, append_images=images[1:])
+
+    with ImagePdfWriter(output_pdf, page_size=page_size, target_dpi=target_dpi) as writer:
+        for i, p in enumerate(image_paths):
+            _check(progress, cancel, i, len(image_paths))
+            writer.add_image(p)
+    _check(progress, None, len(image_paths), len(image_paths))
 
 from pypdf import PdfReader, PdfWriter
-from pypdf.generic import RectangleObject
+from pypdf.generic import FloatObject, NullObject, NumberObject, RectangleObject
+
+
+class IncrementalUpdate:
+    """
+    Appends changed and new objects to an existing PDF as an incremental update
+    (a new xref section whose /Prev points at the original one), so the cost of
+    a save is the size of the change, not of the document. Objects read from
+    the original keep their numbers; new ones are numbered from the trailer's /Size.
+    """
+
+    def __init__(self, reader: PdfReader, source_path):
+        if reader.is_encrypted:
+            raise ValueError("Incremental updates of encrypted PDFs are not supported.")
+        self.reader = reader
+        self.source_path = Path(source_path)
+        self._next = int(reader.trailer["/Size"])
+        self._objects = {}  # idnum -> (generation, object)
+        self._imported = {}  # (id(foreign pdf), idnum) -> IndirectObject here
+
+    def changed(self, obj):
+        """Record an object from the original file as modified (objects without a reference are ignored)."""
+        ref = getattr(obj, "indirect_reference", None)
+        if ref is not None and ref.pdf is self.reader:
+            self._objects[ref.idnum] = (ref.generation, obj)
+
+    def _add_object(self, obj) -> IndirectObject:
+        # Same name as PdfWriter's, so helpers like _Stamper can target either
+        ref = IndirectObject(self._next, 0, self.reader)
+        self._objects[self._next] = (0, obj)
+        self._next += 1
+        return ref
+
+    def import_object(self, obj):
+        """Copy an object from another PDF, adding everything it references as new objects."""
+        if isinstance(obj, IndirectObject):
+            key = (id(obj.pdf), obj.idnum)
+            if key not in self._imported:
+                self._imported[key] = ref = IndirectObject(self._next, 0, self.reader)
+                self._objects[self._next] = (0, NullObject())
+                self._next += 1
+                self._objects[ref.idnum] = (0, self.import_object(obj.get_object()))
+            return self._imported[key]
+        if isinstance(obj, DictionaryObject):
+            copy = StreamObject() if isinstance(obj, StreamObject) else DictionaryObject()
+            if isinstance(obj, StreamObject):
+                copy._data = obj._data
+            for key, value in obj.items():
+                copy[NameObject(key)] = self.import_object(value)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.import_object(v) for v in obj)
+        return obj
+
+    def _previous_xref(self) -> tuple[int, bool]:
+        """Offset of the last xref section, and whether it is an xref stream rather than a table."""
+        with open(self.source_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 2048))
+            tail = f.read()
+            offset = int(tail[tail.rindex(b"startxref") + 9:].split()[0])
+            # pypdf's trailer doesn't say which kind it read, so look: "xref" or "N G obj"
+            f.seek(offset)
+            head = f.read(64).lstrip()
+        return offset, re.match(rb"\d+\s+\d+\s+obj", head) is not None
+
+    def write(self, output_pdf):
+        """Write the update; output_pdf may be the source itself (appended in place) or a new copy."""
+        prev, uses_stream = self._previous_xref()
+        if Path(output_pdf).resolve() != self.source_path.resolve():
+            shutil.copyfile(self.source_path, output_pdf)
+        trailer = self.reader.trailer
+        with open(output_pdf, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            f.write(b"\n")
+            offsets = {}
+            for idnum in sorted(self._objects):
+                gen, obj = self._objects[idnum]
+                offsets[idnum] = (f.tell(), gen)
+                f.write(b"%d %d obj\n" % (idnum, gen))
+                obj.write_to_stream(f)
+                f.write(b"\nendobj\n")
+
+            new_trailer = DictionaryObject({NameObject("/Root"): trailer.raw_get("/Root"),
+                                            NameObject("/Prev"): NumberObject(prev)})
+            for key in ("/Info", "/ID"):
+                if key in trailer:
+                    new_trailer[NameObject(key)] = trailer.raw_get(key)
+
+            xref_at = f.tell()
+            if uses_stream:
+                # The original uses an xref stream, so the update's section is one too
+                offsets[self._next] = (xref_at, 0)
+                width = max(4, (xref_at.bit_length() + 7) // 8)
+                nums = [0, *sorted(offsets)]
+                xref = StreamObject()
+                xref._data = b"\x00" + bytes(width) + b"\xff\xff" + b"".join(
+                    b"\x01" + off.to_bytes(width, "big") + gen.to_bytes(2, "big")
+                    for off, gen in (offsets[n] for n in nums[1:]))
+                xref.update(new_trailer)
+                xref.update({
+                    NameObject("/Type"): NameObject("/XRef"),
+                    NameObject("/Size"): NumberObject(self._next + 1),
+                    NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(width), NumberObject(2)]),
+                    NameObject("/Index"): ArrayObject(NumberObject(v) for n in nums for v in (n, 1)),
+                })
+                f.write(b"%d 0 obj\n" % self._next)
+                xref.write_to_stream(f)
+                f.write(b"\nendobj\n")
+            else:
+                # Starting with the free-list head keeps readers from "correcting" the numbering
+                f.write(b"xref\n0 1\n0000000000 65535 f\r\n")
+                for idnum in sorted(offsets):
+                    off, gen = offsets[idnum]
+                    f.write(b"%d 1\n%010d %05d n\r\n" % (idnum, off, gen))
+                new_trailer[NameObject("/Size")] = NumberObject(self._next)
+                f.write(b"trailer\n")
+                new_trailer.write_to_stream(f)
+            f.write(b"\nstartxref\n%d\n%%%%EOF\n" % xref_at)
+
+
+def _selected_pages(pages: str | None, n_pages: int) -> set[int] | None:
+    return set(parse_page_ranges(str(pages), n_pages)) if pages else None
+
 
-def rotate_pdf(input_pdf: str, output_pdf: str, angle: int = 90):
+@traced("rotate_pdf")
+def rotate_pdf(input_pdf: str, output_pdf: str, angle: int = 90, pages: str | None = None,
+               incremental: bool = False, progress=None, cancel=None):
+    """
+    Rotate every page, or only pages like "3,7-9". With incremental, only the
+    rotated page dictionaries are appended to a copy of the input (or to the
+    input itself when output_pdf is the same path).
+    """
     reader = PdfReader(input_pdf)
-    writer = PdfWriter()
+    n_pages = len(reader.pages)
+    selected = _selected_pages(pages, n_pages)
 
-    for page in reader.pages:
-        page.rotate(angle)
+    if incremental and not reader.is_encrypted:
+        update = IncrementalUpdate(reader, input_pdf)
+        for i in sorted(selected) if selected is not None else range(n_pages):
+            _check(progress, cancel, i, n_pages)
+            page = reader.pages[i]
+            page.rotate(angle)
+            update.changed(page)
+        with span("pdf.write") as s:
+            update.write(output_pdf)
+            s["incremental"] = True
+        _check(progress, None, n_pages, n_pages)
+        return
+
+    writer = PdfWriter()
+    for i, page in enumerate(reader.pages):
+        _check(progress, cancel, i, n_pages)
+        if selected is None or i in selected:
+            page.rotate(angle)
         writer.add_page(page)
 
-    with open(output_pdf, "wb") as f:
-        writer.write(f)
+    _write_pdf(writer, output_pdf)
+    _check(progress, None, n_pages, n_pages)
 
 
-def protect_pdf(input_pdf: str, output_pdf: str, password: str):
+# protect/unlock always rewrite the file: encryption covers every string and stream
+# in the document, so an incremental update would have to append all of them anyway.
+@traced("protect_pdf")
+def protect_pdf(input_pdf: str, output_pdf: str, password: str, progress=None, cancel=None):
     reader = PdfReader(input_pdf)
     writer = PdfWriter()
 
-    for page in reader.pages:
+    for i, page in enumerate(reader.pages):
+        _check(progress, cancel, i, len(reader.pages))
         writer.add_page(page)
 
     writer.encrypt(password)
-    with open(output_pdf, "wb") as f:
-        writer.write(f)
+    _write_pdf(writer, output_pdf)
+    _check(progress, None, len(reader.pages), len(reader.pages))
 
 
-def unlock_pdf(input_pdf: str, output_pdf: str, password: str):
+@traced("unlock_pdf")
+def unlock_pdf(input_pdf: str, output_pdf: str, password: str, progress=None, cancel=None):
     reader = PdfReader(input_pdf)
     if reader.is_encrypted:
         reader.decrypt(password)
 
     writer = PdfWriter()
-    for page in reader.pages:
+    for i, page in enumerate(reader.pages):
+        _check(progress, cancel, i, len(reader.pages))
         writer.add_page(page)
 
-    with open(output_pdf, "wb") as f:
-        writer.write(f)
+    _write_pdf(writer, output_pdf)
+    _check(progress, None, len(reader.pages), len(reader.pages))
+
+canvas = _Lazy("reportlab.pdfgen.canvas")
+stringWidth = _Lazy("reportlab.pdfbase.pdfmetrics", "stringWidth")
+ImageReader = _Lazy("reportlab.lib.utils", "ImageReader")
+import functools, threading
+
+# Rendered stamps are kept per process, so a batch over many files builds each one once
+WATERMARK_CACHE_SIZE = 64
+_stamp_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def _stamp_form(kind: str, source, width: float, height: float, font: str, font_size: float,
+                opacity: float, angle: float, scale: float) -> StreamObject:
+    """
+    Draw one watermark on a width x height canvas (page size as displayed) and
+    return it as a Form XObject. kind is "text" (source = the text) or "image"
+    (source = (path, mtime) so an edited image isn't served stale).
+    """
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=(width, height))
+    c.setFillAlpha(opacity)
+    c.translate(width / 2, height / 2)
+    c.rotate(angle)
+    if kind == "text":
+        # Shrink long text so it still fits along the page diagonal
+        size = min(font_size, 0.9 * (width ** 2 + height ** 2) ** 0.5 / max(stringWidth(source, font, 1), 1))
+        c.setFont(font, size)
+        c.drawCentredString(0, -size / 3, source)
+    else:
+        img = ImageReader(source[0])
+        img_w, img_h = img.getSize()
+        fit = scale * min(width / img_w, height / img_h)
+        c.drawImage(img, -img_w * fit / 2, -img_h * fit / 2, img_w * fit, img_h * fit, mask="auto")
+    c.save()
+
+    page = PdfReader(buf).pages[0]
+    form = StreamObject()
+    form.set_data(page.get_contents().get_data())
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height)]),
+        NameObject("/Resources"): page["/Resources"].get_object(),
+    })
+    return form
+
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from tempfile import NamedTemporaryFile
+def _display_matrix(box, rotate: int) -> tuple:
+    """cm operands mapping upright display space (origin bottom-left of the visible box) to user space."""
+    x0, y0 = float(box.left), float(box.bottom)
+    w, h = float(box.width), float(box.height)
+    return {
+        0: (1, 0, 0, 1, x0, y0),
+        90: (0, 1, -1, 0, x0 + w, y0),
+        180: (-1, 0, 0, -1, x0 + w, y0 + h),
+        270: (0, -1, 1, 0, x0, y0 + h),
+    }[rotate % 360]
+
+
+class _Stamper:
+    """
+    Puts cached watermark forms onto pages of one PdfWriter. Each distinct stamp
+    is added to the output file once and every page only references it.
+    """
 
-def add_text_watermark(input_pdf: str, output_pdf: str, watermark_text: str):
+    def __init__(self, writer: PdfWriter, kind: str, source, font: str = "Helvetica-Bold",
+                 font_size: float = 48, opacity: float = 0.3, angle: float = 45, scale: float = 0.5):
+        self.writer = writer
+        self.style = (kind, source, font, font_size, opacity, angle, scale)
+        self._refs = {}  # (width, height) -> IndirectObject in this writer
+        self._open = None
+
+    def _form_ref(self, width: float, height: float):
+        size = (round(width, 1), round(height, 1))
+        if size not in self._refs:
+            kind, source, font, font_size, opacity, angle, scale = self.style
+            with _stamp_lock:  # cached forms share one reader; clone serially
+                form = _stamp_form(kind, source, *size, font, font_size, opacity, angle, scale)
+                if isinstance(self.writer, IncrementalUpdate):
+                    form = self.writer.import_object(form)
+                else:
+                    form = form.clone(self.writer, force_duplicate=True)
+                self._refs[size] = self.writer._add_object(form)
+        return self._refs[size]
+
+    def apply(self, page):
+        """Stamp a page that already belongs to the writer, upright on its visible (crop) box."""
+        rotate = page.rotation % 360
+        box = page.cropbox
+        width, height = (float(box.height), float(box.width)) if rotate in (90, 270) else (float(box.width), float(box.height))
+        ref = self._form_ref(width, height)
+        name = f"/FtbWm{ref.idnum}"
+
+        resources = page.get("/Resources")
+        if resources is None:
+            resources = page[NameObject("/Resources")] = DictionaryObject()
+        resources = resources.get_object()
+        if "/XObject" not in resources:
+            resources[NameObject("/XObject")] = DictionaryObject()
+        resources["/XObject"].get_object()[NameObject(name)] = ref
+
+        # Wrap the existing content in q/Q so its graphics state can't leak into the stamp
+        if self._open is None:
+            opener = StreamObject()
+            opener.set_data(b"q\n")
+            self._open = self.writer._add_object(opener)
+        stamp = StreamObject()
+        stamp.set_data(b"\nQ q %s cm %s Do Q\n" % (
+            " ".join(f"{v:g}" for v in _display_matrix(box, rotate)).encode(), name.encode()))
+        contents = page.get("/Contents")
+        existing = [] if contents is None else (
+            list(contents.get_object()) if isinstance(contents.get_object(), ArrayObject) else [contents])
+        page[NameObject("/Contents")] = ArrayObject([self._open, *existing, self.writer._add_object(stamp)])
+        if isinstance(self.writer, IncrementalUpdate):
+            for obj in (page, resources, resources["/XObject"].get_object()):
+                self.writer.changed(obj)
+
+
+def _watermark_file(input_pdf: str, output_pdf: str, kind: str, source, pages, incremental, progress, cancel, **style):
     reader = PdfReader(input_pdf)
+    n_pages = len(reader.pages)
+    selected = _selected_pages(pages, n_pages)
+
+    if incremental and not reader.is_encrypted:
+        update = IncrementalUpdate(reader, input_pdf)
+        stamper = _Stamper(update, kind, source, **style)
+        for i in sorted(selected) if selected is not None else range(n_pages):
+            _check(progress, cancel, i, n_pages)
+            stamper.apply(reader.pages[i])
+        with span("pdf.write") as s:
+            update.write(output_pdf)
+            s["incremental"] = True
+        _check(progress, None, n_pages, n_pages)
+        return
+
     writer = PdfWriter()
+    stamper = _Stamper(writer, kind, source, **style)
+    for i, page in enumerate(reader.pages):
+        _check(progress, cancel, i, n_pages)
+        page = writer.add_page(page)
+        if selected is None or i in selected:
+            stamper.apply(page)
+
+    _write_pdf(writer, output_pdf)
+    _check(progress, None, n_pages, n_pages)
+
+
+@traced("add_text_watermark")
+def add_text_watermark(input_pdf: str, output_pdf: str, watermark_text: str, font: str = "Helvetica-Bold",
+                       font_size: float = 48, opacity: float = 0.3, angle: float = 45, pages: str | None = None,
+                       incremental: bool = False, progress=None, cancel=None):
+    """
+    Diagonal text across every page (or only pages like "3,7-9"), sized to each
+    page's visible box and upright whatever its rotation. incremental appends
+    the stamps to the original bytes instead of rewriting the file.
+    """
+    _watermark_file(input_pdf, output_pdf, "text", watermark_text, pages, incremental, progress, cancel,
+                    font=font, font_size=font_size, opacity=opacity, angle=angle)
+
+
+@traced("add_image_watermark")
+def add_image_watermark(input_pdf: str, output_pdf: str, image_path: str, opacity: float = 0.3,
+                        scale: float = 0.5, angle: float = 0, pages: str | None = None,
+                        incremental: bool = False, progress=None, cancel=None):
+    """
+    Centre an image (PNG transparency is kept) on every page, scale = fraction
+    of the page it may fill. pages and incremental work as for add_text_watermark.
+    """
+    source = (str(image_path), os.path.getmtime(image_path))
+    _watermark_file(input_pdf, output_pdf, "image", source, pages, incremental, progress, cancel,
+                    opacity=opacity, angle=angle, scale=scale)
+
+# Steps run_pipeline understands, with the options each one takes
+PIPELINE_STEPS = {
+    "unlock": ("password",),
+    "rotate": ("angle", "pages"),
+    "watermark": ("text", "image", "opacity", "pages"),
+    "protect": ("password",),
+    "compress": ("target_mb",),
+}
 
-    # Create temporary watermark PDF
-    with NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-        c = canvas.Canvas(temp_file.name, pagesize=letter)
-        c.setFont("Helvetica-Bold", 48)
-        c.setFillAlpha(0.3)
-        width, height = letter
-        c.saveState()
-        c.translate(width / 2, height / 2)
-        c.rotate(45)
-        c.drawCentredString(0, 0, watermark_text)
-        c.restoreState()
-        c.save()
-        watermark_pdf = PdfReader(temp_file.name)
-        watermark_page = watermark_pdf.pages[0]
-
-    for page in reader.pages:
-        page.merge_page(watermark_page)
-        writer.add_page(page)
 
-    with open(output_pdf, "wb") as f:
-        writer.write(f)
+def _normalize_steps(steps: list) -> list[dict]:
+    """Accept "rotate" or {"op": "rotate", "angle": 180}; check names, options and ordering."""
+    normalized = []
+    for step in steps:
+        step = {"op": step} if isinstance(step, str) else dict(step)
+        op = step.get("op")
+        if op not in PIPELINE_STEPS:
+            raise ValueError(f"Unknown pipeline step '{op}'. Choose from: {', '.join(PIPELINE_STEPS)}")
+        unknown = set(step) - {"op", *PIPELINE_STEPS[op]}
+        if unknown:
+            raise ValueError(f"Step '{op}' does not take: {', '.join(sorted(unknown))}")
+        normalized.append(step)
 
-import pytesseract
-from pdf2image import convert_from_path
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+    ops = [s["op"] for s in normalized]
+    for op in ("unlock", "protect", "compress"):
+        if ops.count(op) > 1:
+            raise ValueError(f"'{op}' can only appear once in a pipeline.")
+    if "unlock" in ops and ops.index("unlock") != 0:
+        raise ValueError("'unlock' must be the first step.")
+    if "compress" in ops and ops.index("compress") != len(ops) - 1:
+        raise ValueError("'compress' must be the last step.")
+    if "protect" in ops and ops.index("protect") < len(ops) - 1 - ("compress" in ops):
+        raise ValueError("'protect' can only be followed by 'compress'.")
+    return normalized
+
+
+def load_pipeline_spec(path) -> list[dict]:
+    """Read steps from a JSON or YAML file: either a list of steps or {"steps": [...]}."""
+    path = Path(path)
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML pipeline specs need PyYAML (pip install pyyaml).")
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+    steps = spec.get("steps") if isinstance(spec, dict) else spec
+    if not isinstance(steps, list):
+        raise ValueError(f"{path} does not contain a list of steps.")
+    return _normalize_steps(steps)
+
+
+@traced("run_pipeline")
+def run_pipeline(input_pdf: str, output_pdf: str, steps: list, progress=None, cancel=None) -> dict:
+    """
+    Apply several operations in one pass: the input is parsed once, rotate and
+    watermark steps are applied to each page in memory in the order given, and
+    the result is written once. protect encrypts that single write; compress
+    runs Ghostscript on it as the final stage (when combined with protect,
+    encryption is applied after Ghostscript, since gs can't keep it).
+    """
+    steps = _normalize_steps(steps)
+    by_op = {s["op"]: s for s in steps}
+
+    reader = PdfReader(input_pdf)
+    if "unlock" in by_op and reader.is_encrypted:
+        reader.decrypt(str(by_op["unlock"]["password"]))
+    n_pages = len(reader.pages)
+    total = n_pages + ("compress" in by_op)
+
+    # Resolve every page transform up front: (pages it applies to, callable)
+    writer = PdfWriter()
+    transforms = []
+    for step in steps:
+        if step["op"] not in ("rotate", "watermark"):
+            continue
+        pages = set(parse_page_ranges(str(step["pages"]), n_pages)) if step.get("pages") else None
+        if step["op"] == "rotate":
+            angle = int(step.get("angle", 90))
+            transforms.append((pages, lambda page, angle=angle: page.rotate(angle)))
+        else:
+            opacity = float(step.get("opacity", 0.3))
+            if step.get("image"):
+                image = str(step["image"])
+                stamper = _Stamper(writer, "image", (image, os.path.getmtime(image)), opacity=opacity, angle=0)
+            else:
+                stamper = _Stamper(writer, "text", str(step.get("text", "CONFIDENTIAL")), opacity=opacity)
+            transforms.append((pages, stamper.apply))
+
+    for i, page in enumerate(reader.pages):
+        _check(progress, cancel, i, total)
+        page = writer.add_page(page)
+        for pages, apply in transforms:
+            if pages is None or i in pages:
+                apply(page)
+
+    password = str(by_op["protect"]["password"]) if "protect" in by_op else None
+    if "compress" not in by_op:
+        if password is not None:
+            writer.encrypt(password)
+        _write_pdf(writer, output_pdf)
+    else:
+        tmp_name = _temp_pdf()
+        try:
+            _write_pdf(writer, tmp_name)
+            _check(progress, cancel, n_pages, total)
+            target_mb = by_op["compress"].get("target_mb")
+            compress_pdf(tmp_name, tmp_name if password is not None else output_pdf, target_mb)
+            if password is not None:
+                encrypted = PdfWriter(clone_from=tmp_name)
+                encrypted.encrypt(password)
+                _write_pdf(encrypted, output_pdf)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    _check(progress, None, total, total)
+    return {"output": str(output_pdf), "pages": n_pages, "steps": [s["op"] for s in steps]}
+
+import json
+from cache import CACHE_ROOT, DiskCache, hash_key
+from ocr_preprocess import preprocess_image, resolve_preprocess
 
 # Set the path to your Tesseract binary
-pytesseract.pytesseract.tesseract_cmd = r"C:\Users\HP\FileToolbox\bin\Tesseract-OCR\tesseract.exe"
+TESSERACT_CMD = r"C:\Users\HP\FileToolbox\bin\Tesseract-OCR\tesseract.exe"
+pytesseract = _Lazy("pytesseract", on_load=lambda m: setattr(m.pytesseract, "tesseract_cmd", TESSERACT_CMD))
+convert_from_path = _Lazy("pdf2image", "convert_from_path")
+letter = PAGE_SIZES["letter"]  # same as reportlab.lib.pagesizes.letter
+POPPLER_PATH = r"C:\Users\HP\FileToolbox\bin\poppler-24.08.0\Library\bin"
+
+OCR_DPI = 300
+OCR_MAX_MEMORY_MB = 1024
+OCR_MODES = ("searchable", "text")
+OCR_CACHE_MB = 512
+TESS_CONFIG = Path(__file__).with_name("tess-config.txt")
+
+_ocr_cache = None
 
-def ocr_pdf(input_pdf: str, output_pdf: str):
-    images = convert_from_path(
-        input_pdf,
-        dpi=300,
-        poppler_path=r"C:\Users\HP\FileToolbox\bin\poppler-24.08.0\Library\bin"
-    )
-    c = canvas.Canvas(output_pdf, pagesize=letter)
 
+def ocr_cache() -> DiskCache:
+    """Per-process handle on the on-disk OCR result cache."""
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = DiskCache(CACHE_ROOT / "ocr", OCR_CACHE_MB)
+    return _ocr_cache
+
+
+def _ocr_cache_key(img, dpi: int, lang: str, mode: str, preprocess: dict | None = None) -> str:
+    config = TESS_CONFIG.read_bytes() if TESS_CONFIG.exists() else b""
+    # A Tesseract upgrade can change results, so its version is part of the key
+    version = str(pytesseract.get_tesseract_version())
+    return hash_key(img.mode, img.size, img.tobytes(), dpi, lang, mode, config, version,
+                    json.dumps(preprocess, sort_keys=True))
+
+
+def _page_bitmap_bytes(rect, dpi: int) -> int:
+    """Rough RAM cost of one rasterized RGB page (plus Tesseract's working copy)."""
+    return int(rect.width / 72 * dpi * rect.height / 72 * dpi * 3 * 2)
+
+
+def _has_text_layer(page) -> bool:
+    return bool(page.get_text("text").strip())
+
+
+def _ocr_words(img, dpi: int, lang: str, tess_dpi: int, transform: tuple | None = None) -> list[tuple]:
+    """
+    Word boxes in PDF points (rendered page space): (x0, y0, x1, y1, text).
+    transform maps img's pixels back to the rendered page's (see preprocess_image).
+    """
+    data = pytesseract.image_to_data(img, lang=lang, config=f"--dpi {tess_dpi}",
+                                     output_type=pytesseract.Output.DICT)
+    a, b, c, d, e, f = transform or (1, 0, 0, 0, 1, 0)
+    scale = 72 / dpi
+    words = []
+    for i, text in enumerate(data["text"]):
+        text = text.strip()
+        if not text or float(data["conf"][i]) < 0:
+            continue
+        x, y, w, h = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
+        # A deskewed box comes back slightly turned; its bounding box is close enough
+        xs, ys = zip(*((a * px + b * py + c, d * px + e * py + f) for px in (x, x + w) for py in (y, y + h)))
+        words.append((min(xs) * scale, min(ys) * scale, max(xs) * scale, max(ys) * scale, text))
+    return words
+
+
+def _ocr_image(img, dpi: int, mode: str, lang: str, preprocess: dict | None = None):
+    transform, tess_dpi = None, dpi
+    if preprocess:
+        with span("ocr.preprocess"):
+            img, tess_dpi, transform = preprocess_image(img, dpi, preprocess)
+    if mode == "searchable":
+        return _ocr_words(img, dpi, lang, tess_dpi, transform)
+    return pytesseract.image_to_string(img, lang=lang, config=f"--dpi {tess_dpi}")
+
+
+def _ocr_window(input_pdf: str, first: int, last: int, dpi: int, mode: str,
+                lang: str, use_cache: bool, preprocess: dict | None = None) -> list:
+    # Runs in a worker process: rasterize only this window, OCR it, drop the bitmaps.
+    with span("subprocess", tool="pdftoppm", pages=last - first + 1):
+        images = convert_from_path(
+            input_pdf, dpi=dpi, first_page=first, last_page=last, poppler_path=POPPLER_PATH
+        )
+    results = []
     for img in images:
-        text = pytesseract.image_to_string(img)
-        width, height = letter
-        text_lines = text.split("\n")
-        y = height - 50
-        for line in text_lines:
-            c.drawString(40, y, line)
-            y -= 14
-            if y < 40:
-                c.showPage()
-                y = height - 50
-        c.showPage()
+        cached = None
+        if use_cache:
+            key = _ocr_cache_key(img, dpi, lang, mode, preprocess)
+            cached = ocr_cache().get_bytes(key)
+        if cached is not None:
+            results.append(json.loads(cached))
+        else:
+            with span("subprocess", tool="tesseract", pages=1):
+                result = _ocr_image(img, dpi, mode, lang, preprocess)
+            if use_cache:
+                ocr_cache().put_bytes(key, json.dumps(result).encode())
+            results.append(result)
+        img.close()
+    return results
+
+
+def _ocr_pages(input_pdf: str, pages: list[int], page_bytes: int, workers: int | None,
+               max_memory_mb: int, dpi: int, mode: str, lang: str, use_cache: bool, cancel=None,
+               preprocess: dict | None = None):
+    """Yield (page_no, result) for the given 1-based pages, in page order."""
+    if not pages:
+        return
+    budget = max_memory_mb * 1024 * 1024
+    workers = workers or os.cpu_count() or 1
+    # Never run more workers than the memory ceiling can hold one page each
+    workers = max(1, min(workers, budget // page_bytes, len(pages)))
+    chunk = max(1, budget // (workers * page_bytes))
+    # Keep windows small enough that every worker gets some work
+    chunk = min(chunk, max(1, -(-len(pages) // workers)))
+
+    windows = list(_page_windows(pages, chunk))
+    results = _pool_results(
+        _ocr_window,
+        [(input_pdf, first, last, dpi, mode, lang, use_cache, preprocess) for first, last in windows],
+        workers,
+        cancel,
+    )
+    for (first, last), page_results in zip(windows, results):
+        yield from zip(range(first, last + 1), page_results)
+
+
+def _resumed_results(todo: list[int], checkpoint: Checkpoint, fresh):
+    """
+    Yield (page_no, result) for every page in todo, in order: checkpointed pages
+    are read back from disk, the rest come from fresh (which covers exactly those
+    pages, in order) and are checkpointed as they arrive.
+    """
+    for page_no in todo:
+        if checkpoint.is_done(page_no):
+            yield page_no, checkpoint.load_part(page_no)
+            continue
+        fresh_no, result = next(fresh)
+        checkpoint.save_part(fresh_no, result)
+        yield fresh_no, result
+
+
+def _add_text_layer(page, words: list[tuple]):
+    """Overlay OCR words as invisible text (render mode 3); page images are left untouched."""
+    shape = page.new_shape()
+    derotate = page.derotation_matrix
+    for x0, y0, x1, y1, text in words:
+        size = max(1.0, (y1 - y0) * 0.9)
+        length = fitz.get_text_length(text, fontname="helv", fontsize=size)
+        origin = fitz.Point(x0, y1) * derotate
+        # Stretch each word along its line so selection boxes match the scanned word;
+        # morph works in unrotated page space, where a /Rotate 90 or 270 line runs along y
+        scale = (x1 - x0) / length if length else 1
+        stretch = fitz.Matrix(1, scale) if page.rotation % 180 else fitz.Matrix(scale, 1)
+        shape.insert_text(origin, text, fontname="helv", fontsize=size, render_mode=3,
+                          rotate=page.rotation, morph=(origin, stretch))
+    shape.commit()
+
+
+def _draw_text_page(c, text: str):
+    width, height = letter
+    y = height - 50
+    for line in text.split("\n"):
+        c.drawString(40, y, line)
+        y -= 14
+        if y < 40:
+            c.showPage()
+            y = height - 50
+    c.showPage()
 
+
+@traced("ocr_pdf")
+def ocr_pdf(input_pdf: str, output_pdf: str, workers: int | None = None,
+            max_memory_mb: int = OCR_MAX_MEMORY_MB, dpi: int = OCR_DPI,
+            mode: str = "searchable", skip_text: bool = True, lang: str = "eng",
+            use_cache: bool = True, resume: bool = False, preprocess=None, progress=None, cancel=None):
+    """
+    OCR a scanned PDF without holding the whole document in memory.
+    Pages are rasterized in first_page/last_page windows inside a process pool,
+    so at most workers * window pages are resident at once (kept under max_memory_mb).
+
+    mode="searchable" keeps the original pages and adds an invisible text layer;
+    mode="text" re-typesets the recognized text onto plain letter pages.
+    With skip_text, pages that already have a text layer are not OCR'd (looked
+    up in the document profile index when possible, instead of scanning pages).
+    With use_cache, results are looked up by a hash of the rendered page plus
+    dpi/lang/tess-config.txt/Tesseract version, so re-running an unchanged scan skips Tesseract.
+    preprocess cleans each page up before Tesseract sees it: a preset name
+    ("clean", "fast"), a dict of ocr_preprocess.PREPROCESS_DEFAULTS overrides, or None.
+    Each recognized page is checkpointed beside the output (<output>.ftbjob.json);
+    with resume, a run that died part-way only OCRs the pages still missing.
+    """
+    if mode not in OCR_MODES:
+        raise ValueError(f"Unknown OCR mode: {mode}")
+    preprocess = resolve_preprocess(preprocess)
+    profile = _profile(input_pdf) if skip_text else None
+    indexed = text_pages(profile) if profile is not None else None
+    doc = fitz.open(input_pdf)
+    with span("ocr.scan", pages=doc.page_count, indexed=indexed is not None) as s:
+        if indexed is not None:
+            has_text = set(indexed)
+            todo = [p for p in range(1, doc.page_count + 1) if p not in has_text]
+        else:
+            todo = [page.number + 1 for page in doc if not (skip_text and _has_text_layer(page))]
+        s["ocr_pages"] = len(todo)
+    params = {"dpi": dpi, "mode": mode, "skip_text": skip_text, "lang": lang, "preprocess": preprocess}
+    checkpoint = Checkpoint(output_pdf, "ocr_pdf", input_pdf, params, resume=resume)
+    pending = [p for p in todo if not checkpoint.is_done(p)]
+    page_bytes = max((_page_bitmap_bytes(doc[p - 1].rect, dpi) for p in pending), default=1)
+    ocr_results = _resumed_results(
+        todo, checkpoint,
+        _ocr_pages(input_pdf, pending, page_bytes, workers, max_memory_mb, dpi, mode, lang, use_cache, cancel,
+                   preprocess),
+    )
+    # Write beside the output and rename, so a crash never leaves a half-written PDF
+    tmp_output = f"{output_pdf}.part"
+
+    _check(progress, cancel, 0, len(todo))
+    if mode == "searchable":
+        # Time here includes waiting on the pool; worker spans break it down
+        with span("ocr.pages", pages=len(todo)):
+            for done, (pno, words) in enumerate(ocr_results, 1):
+                _add_text_layer(doc[pno - 1], words)
+                _check(progress, cancel, done, len(todo))
+        # Existing image streams are copied as-is, only new text streams get deflated
+        with span("pdf.write") as s:
+            doc.save(tmp_output, deflate=True)
+            s["bytes_out"] = os.path.getsize(tmp_output)
+        doc.close()
+        os.replace(tmp_output, output_pdf)
+        checkpoint.finish()
+        return
+
+    c = canvas.Canvas(tmp_output, pagesize=letter)
+    needs_ocr = set(todo)
+    for page in doc:
+        if page.number + 1 in needs_ocr:
+            _, text = next(ocr_results)
+            needs_ocr.discard(page.number + 1)
+            _check(progress, cancel, len(todo) - len(needs_ocr), len(todo))
+        else:
+            # Page already has a text layer, reuse it instead of OCR'ing
+            text = page.get_text("text")
+        _draw_text_page(c, text)
     c.save()
+    doc.close()
+    os.replace(tmp_output, output_pdf)
+    checkpoint.finish()
@@ -0,0 +1,351 @@
+# service.py
+"""
+Long-running local service: keeps pdf_tools/office_tools imported, the soffice
+pool warm, and runs submitted operations as background jobs.
+
+    python app.py serve            # foreground; Ctrl+C or `app.py serve --stop` to end
+
+It listens on 127.0.0.1 only and records its port and a random token in
+~/.filetoolbox/service.json (owner-readable); every request must carry the
+token. While that file points at a live service, CLI commands submit to it
+instead of running in-process (see call()); FILETOOLBOX_LOCAL=1 (or the
+--local CLI flag) opts out.
+"""
+import itertools, json, os, secrets, threading, time, urllib.error, urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+STATE_FILE = Path(os.environ.get("FILETOOLBOX_SERVICE", Path.home() / ".filetoolbox" / "service.json"))
+TOKEN_HEADER = "X-FileToolbox-Token"
+MAX_QUEUE = 32          # queued + running jobs before submissions get 429
+DEFAULT_LIMIT = 2       # concurrent jobs per operation unless listed below
+OP_LIMITS = {
+    "ocr_pdf": 1,       # already spreads each job over every core
+    "split_pdf": 1,
+    "pdf_to_docx": 1,
+    "pdf_to_excel": 1,
+    "render_pages": 1,
+    "pdf_to_images": 1,
+    "pdf_to_pptx": 1,
+    "convert_with_soffice": 4,  # the soffice pool does the real limiting
+}
+POLL_INTERVAL = 0.2
+JOB_RETENTION = 600     # seconds a finished job stays queryable
+MAX_FINISHED = 200      # finished jobs kept at most, newest first
+
+
+def _operations() -> dict:
+    """Operation name -> (function, accepts progress/cancel hooks)."""
+    import office_tools
+    import pdf_tools
+    hooked = [
+        "merge_pdfs", "split_pdf", "compress_pdf", "compress_pdf_adaptive", "pdf_to_docx", "pdf_to_excel",
+        "pdf_to_pptx", "pdf_to_images", "images_to_pdf", "rotate_pdf", "protect_pdf", "unlock_pdf",
+        "add_text_watermark", "add_image_watermark", "run_pipeline", "ocr_pdf",
+    ]
+    ops = {name: (getattr(pdf_tools, name), True) for name in hooked}
+    ops["convert_with_soffice"] = (office_tools.convert_with_soffice, False)
+    ops["convert_many_with_soffice"] = (office_tools.convert_many_with_soffice, False)
+    return ops
+
+
+class Service:
+    """
+    One JobManager per operation, sized to that operation's concurrency limit,
+    behind a shared cap on outstanding jobs. Job ids are global across managers.
+    Finished jobs are forgotten after JOB_RETENTION seconds, or sooner beyond
+    the newest MAX_FINISHED, so a long-running service doesn't keep every result.
+    """
+
+    def __init__(self, max_queue: int = MAX_QUEUE):
+        from jobs import JobManager
+        self._manager_cls = JobManager
+        self.ops = _operations()
+        self.max_queue = max_queue
+        self._managers = {}
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _manager(self, op: str):
+        if op not in self._managers:
+            self._managers[op] = self._manager_cls(max_workers=OP_LIMITS.get(op, DEFAULT_LIMIT))
+        return self._managers[op]
+
+    def outstanding(self) -> int:
+        from jobs import QUEUED, RUNNING
+        return sum(1 for _, job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def _prune(self):
+        # Caller holds self._lock
+        from jobs import CANCELLED, DONE, FAILED
+        now = time.monotonic()
+        finished = sorted((job.finished or now, job_id) for job_id, (_, job) in self._jobs.items()
+                          if job.status in (DONE, FAILED, CANCELLED))
+        excess = len(finished) - MAX_FINISHED
+        for k, (ended, job_id) in enumerate(finished):
+            if k < excess or now - ended > JOB_RETENTION:
+                op, job = self._jobs.pop(job_id)
+                self._managers[op].forget(job.id)
+
+    def job_ids(self) -> list[str]:
+        with self._lock:
+            self._prune()
+            return list(self._jobs)
+
+    def submit(self, op: str, args: list, kwargs: dict) -> str | None:
+        """Queue a job; returns its id, or None when the queue is full."""
+        if op not in self.ops:
+            raise KeyError(op)
+        func, hooks = self.ops[op]
+        with self._lock:
+            self._prune()
+            if self.outstanding() >= self.max_queue:
+                return None
+            job = self._manager(op).submit(op, func, *args, hooks=hooks, **kwargs)
+            job_id = str(next(self._ids))
+            self._jobs[job_id] = (op, job)
+        return job_id
+
+    def status(self, job_id: str) -> dict | None:
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            return None
+        op, job = entry
+        return {
+            "id": job_id,
+            "op": op,
+            "status": job.status,
+            "done": job.done,
+            "total": job.total,
+            "unit": job.unit,
+            "elapsed": round(job.elapsed, 3),
+            "eta": None if job.eta is None else round(job.eta, 1),
+            "result": job.result,
+            "error": None if job.error is None else f"{type(job.error).__name__}: {job.error}",
+        }
+
+    def cancel(self, job_id: str) -> bool:
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            return False
+        op, job = entry
+        self._managers[op].cancel(job.id)
+        return True
+
+    def summary(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "outstanding": self.outstanding(),
+            "max_queue": self.max_queue,
+            "jobs": len(self._jobs),
+            "operations": sorted(self.ops),
+        }
+
+    def shutdown(self):
+        for manager in self._managers.values():
+            manager.shutdown()
+
+
+def _warm_up():
+    """Import the heavy libraries now so the first job doesn't pay for them."""
+    import pdf_tools
+    for lazy in (pdf_tools.fitz, pdf_tools.Converter, pdf_tools.pdfplumber, pdf_tools.Image,
+                 pdf_tools.canvas, pdf_tools.pytesseract, pdf_tools.convert_from_path):
+        try:
+            lazy._resolve()
+        except Exception:  # a missing optional library only matters to the ops that need it
+            pass
+
+
+def _handler(service: Service, token: str, server_ref: list):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):  # keep the console quiet
+            pass
+
+        def _send(self, code: int, body: dict, headers: dict | None = None):
+            data = json.dumps(body, default=str).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self) -> bool:
+            if secrets.compare_digest(self.headers.get(TOKEN_HEADER, ""), token):
+                return True
+            self._send(403, {"error": "bad token"})
+            return False
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            parts = self.path.strip("/").split("/")
+            if parts == ["health"]:
+                self._send(200, service.summary())
+            elif parts == ["jobs"]:
+                self._send(200, {"jobs": [s for s in map(service.status, service.job_ids()) if s]})
+            elif len(parts) == 2 and parts[0] == "jobs":
+                status = service.status(parts[1])
+                self._send(200, status) if status else self._send(404, {"error": "no such job"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            if self.path == "/jobs":
+                try:
+                    body = self._body()
+                    job_id = service.submit(body["op"], body.get("args", []), body.get("kwargs", {}))
+                except KeyError as e:
+                    self._send(400, {"error": f"unknown operation or missing field: {e}"})
+                    return
+                except ValueError as e:
+                    self._send(400, {"error": f"bad request: {e}"})
+                    return
+                if job_id is None:
+                    # Backpressure: the client waits and retries
+                    self._send(429, {"error": "queue full"}, {"Retry-After": "1"})
+                else:
+                    self._send(202, {"id": job_id})
+            elif self.path == "/shutdown":
+                self._send(200, {"ok": True})
+                threading.Thread(target=server_ref[0].shutdown, daemon=True).start()
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_DELETE(self):
+            if not self._authorized():
+                return
+            parts = self.path.strip("/").split("/")
+            if len(parts) == 2 and parts[0] == "jobs" and service.cancel(parts[1]):
+                self._send(200, {"ok": True})
+            else:
+                self._send(404, {"error": "no such job"})
+
+    return Handler
+
+
+def serve(port: int = 0, max_queue: int = MAX_QUEUE):
+    """Run the service until shutdown; port 0 picks a free one."""
+    service = Service(max_queue)
+    token = secrets.token_hex(16)
+    server_ref = []
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(service, token, server_ref))
+    server.daemon_threads = True
+    server_ref.append(server)
+    threading.Thread(target=_warm_up, daemon=True).start()
+
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_name(STATE_FILE.name + ".part")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"port": server.server_address[1], "pid": os.getpid(), "token": token}, f)
+    os.replace(tmp, STATE_FILE)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.shutdown()
+        # Only remove the state file if it is still ours
+        try:
+            if json.loads(STATE_FILE.read_text()).get("pid") == os.getpid():
+                STATE_FILE.unlink()
+        except (OSError, ValueError):
+            pass
+
+
+class ServiceError(RuntimeError):
+    """A job submitted to the service failed."""
+
+
+class Client:
+    def __init__(self, port: int, token: str, timeout: float = 5):
+        self.base = f"http://127.0.0.1:{port}"
+        self.token = token
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, body: dict | None = None) -> tuple[int, dict]:
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method,
+                                     headers={TOKEN_HEADER: self.token, "Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, json.loads(resp.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b"{}")
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")[1]
+
+    def submit(self, op: str, *args, **kwargs) -> str:
+        """Submit a job, waiting while the service reports a full queue."""
+        while True:
+            code, body = self._request("POST", "/jobs", {"op": op, "args": args, "kwargs": kwargs})
+            if code == 202:
+                return body["id"]
+            if code != 429:
+                raise ServiceError(body.get("error", f"HTTP {code}"))
+            time.sleep(1)
+
+    def status(self, job_id: str) -> dict:
+        return self._request("GET", f"/jobs/{job_id}")[1]
+
+    def cancel(self, job_id: str):
+        self._request("DELETE", f"/jobs/{job_id}")
+
+    def wait(self, job_id: str, progress=None):
+        """Block until the job finishes; returns its result or raises ServiceError."""
+        from jobs import CANCELLED, DONE, FAILED
+        try:
+            while True:
+                status = self.status(job_id)
+                if "status" not in status:  # forgotten: finished longer ago than JOB_RETENTION
+                    raise ServiceError(status.get("error", "no such job"))
+                if progress is not None and status.get("total"):
+                    progress(status["done"], status["total"])
+                if status["status"] == DONE:
+                    return status["result"]
+                if status["status"] in (FAILED, CANCELLED):
+                    raise ServiceError(status.get("error") or status["status"])
+                time.sleep(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            self.cancel(job_id)
+            raise
+
+    def stop(self):
+        self._request("POST", "/shutdown", {})
+
+
+def client() -> Client | None:
+    """A client for the running service, or None if there isn't one."""
+    try:
+        state = json.loads(STATE_FILE.read_text())
+        c = Client(state["port"], state["token"], timeout=2)
+        c.health()
+    except (OSError, ValueError, KeyError):
+        return None
+    c.timeout = 30
+    return c
+
+
+def call(op: str, *args, **kwargs):
+    """
+    Run a pdf_tools/office_tools operation through the service if one is running,
+    otherwise in this process. Path arguments must already be absolute when the
+    service may be used, since it has its own working directory.
+    """
+    c = None if os.environ.get("FILETOOLBOX_LOCAL") else client()
+    if c is not None:
+        return c.wait(c.submit(op, *args, **kwargs))
+    func, _ = _operations()[op]
+    return func(*args, **kwargs)
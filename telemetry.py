@@ -0,0 +1,170 @@
+# telemetry.py
+"""
+Lightweight tracing for FileToolbox operations.
+
+Spans are written as one JSON object per line to the file named by
+FILETOOLBOX_TRACE. The setting lives in the environment so process-pool
+workers (OCR windows, split writers, ...) inherit it and append to the same
+log. With no trace file configured, span() costs one environment lookup.
+"""
+import contextlib, functools, itertools, json, os, threading, time, uuid
+from pathlib import Path
+
+TRACE_ENV = "FILETOOLBOX_TRACE"
+RUN_ENV = "FILETOOLBOX_RUN_ID"
+
+_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+
+
+def enable(trace_path, run_id: str | None = None) -> str:
+    """Start writing spans to trace_path (appending); returns the run id tagged on every span."""
+    run_id = run_id or uuid.uuid4().hex[:12]
+    os.environ[TRACE_ENV] = str(Path(trace_path).resolve())
+    os.environ[RUN_ENV] = run_id
+    return run_id
+
+
+def disable():
+    os.environ.pop(TRACE_ENV, None)
+    os.environ.pop(RUN_ENV, None)
+
+
+def enabled() -> bool:
+    return bool(os.environ.get(TRACE_ENV))
+
+
+def _emit(record: dict):
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        # Small O_APPEND writes don't interleave, even across worker processes
+        with open(os.environ[TRACE_ENV], "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    Time a block. Yields a dict the block can add fields to (pages, bytes_out, ...);
+    they are logged with the span when it ends. Nested spans record their parent.
+    """
+    if not enabled():
+        yield attrs
+        return
+    stack = _local.__dict__.setdefault("stack", [])
+    span_id = f"{os.getpid()}-{next(_ids)}"
+    record = {
+        "run": os.environ.get(RUN_ENV),
+        "span": span_id,
+        "parent": stack[-1] if stack else None,
+        "name": name,
+        "pid": os.getpid(),
+        "start": round(time.time(), 6),
+    }
+    stack.append(span_id)
+    start = time.perf_counter()
+    status, error = "ok", None
+    try:
+        yield attrs
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        record.update(seconds=round(time.perf_counter() - start, 6), status=status, **attrs)
+        if error:
+            record["error"] = error
+        _emit(record)
+
+
+def path_bytes(path) -> int | None:
+    """Size of a file, a directory's files, or a list of either; None if nothing is there."""
+    if isinstance(path, (list, tuple)):
+        sizes = [path_bytes(p) for p in path]
+        return sum(s for s in sizes if s) if any(s is not None for s in sizes) else None
+    try:
+        path = Path(path)
+        if path.is_dir():
+            return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+        return path.stat().st_size
+    except (TypeError, OSError):
+        return None
+
+
+def traced(name: str):
+    """
+    Decorator for operations shaped like op(input, output, ..., progress=None): the
+    call becomes a span with bytes_in from the first argument, bytes_out from the
+    second and units (usually pages) from the last progress report.
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            with span(name, bytes_in=path_bytes(args[0]) if args else None) as s:
+                outer = kwargs.get("progress")
+
+                def progress(done, total):
+                    s["units"] = total
+                    if outer is not None:
+                        outer(done, total)
+
+                result = func(*args, **dict(kwargs, progress=progress))
+                if len(args) > 1:
+                    s["bytes_out"] = path_bytes(args[1])
+                return result
+        return inner
+    return wrap
+
+
+def read_spans(trace_path, run_id: str | None = None) -> list[dict]:
+    spans = []
+    with open(trace_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:  # a worker killed mid-write
+                continue
+            if run_id is None or record.get("run") == run_id:
+                spans.append(record)
+    return spans
+
+
+def write_prometheus(metrics_path, spans: list[dict]):
+    """Aggregate spans into a Prometheus text-format file (node_exporter textfile collector style)."""
+    totals = {}
+    for s in spans:
+        key = (s["name"], s.get("tool") or "")
+        t = totals.setdefault(key, {"count": 0, "errors": 0, "seconds": 0.0, "pages": 0,
+                                    "units": 0, "bytes_in": 0, "bytes_out": 0})
+        t["count"] += 1
+        t["errors"] += s.get("status") == "error"
+        t["seconds"] += s.get("seconds", 0.0)
+        for field in ("pages", "units", "bytes_in", "bytes_out"):
+            t[field] += s.get(field) or 0
+
+    metrics = [
+        ("span_count_total", "count", "Completed spans"),
+        ("span_errors_total", "errors", "Spans that raised"),
+        ("span_seconds_total", "seconds", "Wall time spent in spans"),
+        ("pages_total", "pages", "Pages processed"),
+        # From @traced operations' progress totals: pages for most, files or passes for some
+        ("units_total", "units", "Progress units of traced operations"),
+        ("bytes_in_total", "bytes_in", "Input bytes"),
+        ("bytes_out_total", "bytes_out", "Output bytes"),
+    ]
+    lines = []
+    for metric, field, help_text in metrics:
+        lines.append(f"# HELP filetoolbox_{metric} {help_text}")
+        lines.append(f"# TYPE filetoolbox_{metric} counter")
+        for (name, tool), t in sorted(totals.items()):
+            labels = f'span="{name}"' + (f',tool="{tool}"' if tool else "")
+            lines.append(f"filetoolbox_{metric}{{{labels}}} {t[field]:g}")
+
+    # Write and rename so a collector never scrapes half a file
+    metrics_path = Path(metrics_path)
+    tmp = metrics_path.with_name(metrics_path.name + ".part")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, metrics_path)